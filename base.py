@@ -1,12 +1,24 @@
 import re
+from bisect import bisect_right
+from itertools import accumulate
 from re import Pattern
-from typing import Any, Generator, Tuple, Union
+from typing import Any, Generator, Iterable, List, Tuple, Union
 
-from sublime import View
+from sublime import Edit, Region, View
 from sublime_api import view_cached_substr as substr  # pyright: ignore
+from sublime_api import view_erase, view_insert, view_replace  # pyright: ignore
+from sublime_api import view_selection_add_region as add_region  # pyright: ignore
 
 CHUNKSIZE = 10_000
 
+
+def buffer_chunks(
+    vid: int, start: int, end: int, size: int = 1 << 20
+) -> Generator[str, None, None]:
+    for a in range(start, end, size):
+        yield substr(vid, a, min(a + size, end))
+
+
 def buffer_slice(
     v: View, forward: bool, default_yield_border: bool = False
 ) -> Generator[Union[None, Tuple[int, int]], Tuple[Any, int, Pattern], None]:
@@ -69,3 +81,240 @@ def buffer_slice(
                     break
             else:
                 index = _e - 1
+
+
+Interval = Tuple[int, int]
+
+
+def normalize_intervals(intervals: Iterable[Interval]) -> List[Interval]:
+    """Sorts the intervals and merges the overlapping ones. Empty intervals
+    (cursors) inside a non-empty one are absorbed by it."""
+    merged: List[Interval] = []
+    for a, b in sorted((a, b) if a <= b else (b, a) for a, b in intervals):
+        if merged:
+            ma, mb = merged[-1]
+            if a < mb or a == mb and (a == b or ma == mb):
+                merged[-1] = (ma, max(mb, b))
+                continue
+        merged.append((a, b))
+    return merged
+
+
+def union_intervals(left: Iterable[Interval], right: Iterable[Interval]):
+    return normalize_intervals([*left, *right])
+
+
+def intersect_intervals(left: Iterable[Interval], right: Iterable[Interval]):
+    lhs = normalize_intervals(left)
+    rhs = normalize_intervals(right)
+    result: List[Interval] = []
+    i = j = 0
+    while i < len(lhs) and j < len(rhs):
+        la, lb = lhs[i]
+        ra, rb = rhs[j]
+        lo = max(la, ra)
+        hi = min(lb, rb)
+        if lo < hi or lo == hi and (la == lb or ra == rb):
+            result.append((lo, hi))
+        if lb < rb or lb == rb and la == lb:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+def subtract_intervals(left: Iterable[Interval], right: Iterable[Interval]):
+    """Removes everything covered by right from left. Cursors are dropped
+    when they lie inside, or on the border of, a subtracted interval."""
+    lhs = normalize_intervals(left)
+    rhs = normalize_intervals(right)
+    result: List[Interval] = []
+    j = 0
+    for a, b in lhs:
+        while j < len(rhs) and rhs[j][1] < a:
+            j += 1
+        if a == b:
+            if j == len(rhs) or rhs[j][0] > a:
+                result.append((a, b))
+            continue
+        k = j
+        while k < len(rhs) and rhs[k][0] < b:
+            ra, rb = rhs[k]
+            k += 1
+            if ra == rb:
+                continue
+            if ra > a:
+                result.append((a, ra))
+            a = max(a, rb)
+        if a < b:
+            result.append((a, b))
+    return result
+
+
+def substr_many(
+    vid: int, regions: Iterable[Interval], gap: int = CHUNKSIZE
+) -> List[str]:
+    """
+    Returns the text of every region, in the order given. The regions are
+    sorted and merged into covering spans, joining neighbours that are at
+    most gap characters apart, and each span is fetched with one substr;
+    the texts are slices of those spans. A span stops growing once the text
+    between its regions would exceed the text of the regions by more than
+    gap, so scattered regions never read much more than they return.
+    """
+    bounds = [(a, b) if a <= b else (b, a) for a, b in regions]
+    texts = [""] * len(bounds)
+    order = sorted(range(len(bounds)), key=bounds.__getitem__)
+
+    i = 0
+    while i < len(order):
+        first, last = bounds[order[i]]
+        wanted = last - first
+        wasted = 0
+        j = i + 1
+        while j < len(order):
+            a, b = bounds[order[j]]
+            skipped = max(0, a - last)
+            if skipped > gap or wasted + skipped > wanted + gap:
+                break
+            wasted += skipped
+            wanted += max(0, b - max(a, last))
+            last = max(last, b)
+            j += 1
+
+        span = substr(vid, first, last)
+        for k in order[i:j]:
+            a, b = bounds[k]
+            texts[k] = span[a - first : b - first]
+        i = j
+    return texts
+
+
+def lines_around(
+    v: View, pts: Iterable[int], window: int = 1024
+) -> List[Tuple[int, str]]:
+    """
+    Returns the start and text (without newline) of the line of every
+    point, in the order given. The buffer is read in spans covering the
+    window around each point, neighbouring windows sharing one substr; only
+    lines that do not fit in their span are read on their own.
+    """
+    vid = v.id()
+    size = v.size()
+    pts = [min(max(pt, 0), size) for pt in pts]
+    lines: List[Tuple[int, str]] = [(0, "")] * len(pts)
+    order = sorted(range(len(pts)), key=pts.__getitem__)
+
+    i = 0
+    while i < len(order):
+        first = max(0, pts[order[i]] - window)
+        last = min(size, pts[order[i]] + window)
+        j = i + 1
+        while j < len(order) and pts[order[j]] - window <= last:
+            last = min(size, pts[order[j]] + window)
+            j += 1
+
+        span = substr(vid, first, last)
+        for k in order[i:j]:
+            pt = pts[k] - first
+            a = span.rfind("\n", 0, pt) + 1
+            b = span.find("\n", pt)
+            if (a == 0 and first > 0) or (b == -1 and last < size):
+                line = v.line(pts[k])
+                lines[k] = (line.a, v.substr(line))
+            else:
+                lines[k] = (first + a, span[a : len(span) if b == -1 else b])
+        i = j
+    return lines
+
+
+def set_selection(v: View, regions: Iterable[Interval]) -> None:
+    vid = v.id()
+    v.sel().clear()
+    for a, b in regions:
+        add_region(vid, a, b, 0.0)
+
+
+class EditBatch:
+    """
+    Collects the edits of a multi-cursor command and applies them in one
+    back-to-front pass. Overlapping edits are clipped so that each piece of
+    the buffer is replaced at most once, and adjacent edits are merged into
+    a single API call. Offsets from before the edits can be translated with
+    map(), so a command can compute its final selection without reading it
+    back from the view.
+    """
+
+    def __init__(self, v: View, edit: Edit):
+        self.view = v
+        self.vid = v.id()
+        self.token = edit.edit_token
+        self.edits: List[Tuple[int, int, str]] = []
+        self.ends: List[int] = []
+        self.shifts: List[int] = [0]
+
+    def replace(self, a: int, b: int, text: str) -> None:
+        self.edits.append((a, b, text) if a <= b else (b, a, text))
+
+    def insert(self, pt: int, text: str) -> None:
+        self.edits.append((pt, pt, text))
+
+    def erase(self, a: int, b: int) -> None:
+        self.replace(a, b, "")
+
+    def apply(self, clear_selection: bool = False) -> None:
+        """Performs the edits. With clear_selection the selection is emptied
+        first, which spares the editor from adjusting every cursor after
+        every edit; the caller is then expected to set a new one."""
+        edits: List[Tuple[int, int, str]] = []
+        for a, b, text in sorted(self.edits, key=lambda e: (e[0], e[1])):
+            if edits and a < edits[-1][1]:
+                a = edits[-1][1]
+                b = max(a, b)
+            edits.append((a, b, text))
+
+        self.edits = edits
+        self.ends = [b for _, b, _ in edits]
+        self.shifts = list(
+            accumulate((len(text) - (b - a) for a, b, text in edits), initial=0)
+        )
+
+        # Edits that touch are applied as one
+        groups: List[Tuple[int, int, List[str]]] = []
+        for a, b, text in edits:
+            if groups and a == groups[-1][1]:
+                start, _, texts = groups[-1]
+                texts.append(text)
+                groups[-1] = (start, b, texts)
+            elif text or a != b:
+                groups.append((a, b, [text]))
+        merged = [(a, b, "".join(texts)) for a, b, texts in groups]
+
+        if clear_selection:
+            self.view.sel().clear()
+
+        vid = self.vid
+        token = self.token
+        for a, b, text in reversed(merged):
+            if a == b:
+                view_insert(vid, token, a, text)
+            elif text:
+                view_replace(vid, token, Region(a, b), text)
+            else:
+                view_erase(vid, token, Region(a, b))
+
+    def map(self, pt: int, after: bool = True) -> int:
+        """Translates a point from before the edits to after them. Text
+        inserted exactly at pt ends up before it when after is set. A point
+        inside a replaced span moves to the end (or start) of its
+        replacement."""
+        i = bisect_right(self.ends, pt)
+        if not after:
+            while i > 0 and self.edits[i - 1][0] == pt:
+                i -= 1
+
+        shift = self.shifts[i]
+        if i < len(self.edits) and self.edits[i][0] < pt:
+            a, _, text = self.edits[i]
+            return a + shift + (len(text) if after else 0)
+        return pt + shift
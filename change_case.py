@@ -0,0 +1,99 @@
+import re
+import string
+from typing import Callable, Dict, List
+
+from sublime import Edit
+from sublime_plugin import TextCommand
+
+from .base import EditBatch, lines_around, set_selection, substr_many
+
+# Words of an identifier: acronyms, capitalized or lower case words, each
+# keeping the digits that follow it, and leading digits on their own
+WORD = re.compile(r"[A-Z]+(?![a-z])\d*|[A-Z]?[a-z]+\d*|[^\W_]+")
+# An identifier without its leading and trailing underscores, kebab case
+# ones included
+IDENTIFIER = re.compile(r"[^\W_]+(?:[_-]+[^\W_]+)*")
+
+
+def words(text: str) -> List[str]:
+    return WORD.findall(text)
+
+
+def join_words(join: Callable[[List[str]], str]) -> Callable[[str], str]:
+    """Applies join to the words of every identifier in the text, keeping
+    everything between the identifiers as it is."""
+
+    def convert(text: str) -> str:
+        return IDENTIFIER.sub(lambda m: join(words(m.group())), text)
+
+    return convert
+
+
+def capitalize(word: str) -> str:
+    return word[:1].upper() + word[1:].lower()
+
+
+CASES: Dict[str, Callable[[str], str]] = {
+    "upper": str.upper,
+    "lower": str.lower,
+    # as the built-in title_case, words only split at spaces
+    "title": lambda text: string.capwords(text, " "),
+    "snake": join_words(lambda ws: "_".join(w.lower() for w in ws)),
+    "kebab": join_words(lambda ws: "-".join(w.lower() for w in ws)),
+    "pascal": join_words(lambda ws: "".join(map(capitalize, ws))),
+    "camel": join_words(
+        lambda ws: "".join([ws[0].lower(), *map(capitalize, ws[1:])]) if ws else ""
+    ),
+}
+
+
+class ChangeCaseCommand(TextCommand):
+    """
+    Converts every selection, or the word under an empty one, to one of
+    CASES. The texts are read in one go and the results written in one
+    batched replace.
+    """
+
+    def run(self, edit: Edit, case: str = "upper") -> None:
+        v = self.view
+        convert = CASES[case]
+        regs = [(r.a, r.b) for r in v.sel()]
+
+        separators = v.settings().get("word_separators", "") + " \t\n"
+        cursors = [a for a, b in regs if a == b]
+        word_bounds = {}
+        for pt, (start, line) in zip(cursors, lines_around(v, cursors)):
+            col = pt - start
+            a = col
+            while a > 0 and line[a - 1] not in separators:
+                a -= 1
+            b = col
+            while b < len(line) and line[b] not in separators:
+                b += 1
+            word_bounds[pt] = (start + a, start + b)
+
+        bounds = [
+            word_bounds[a] if a == b else (min(a, b), max(a, b)) for a, b in regs
+        ]
+        batch = EditBatch(v, edit)
+        last = -1
+        # Cursors in the same word convert it once
+        for (a, b), text in zip(bounds, substr_many(v.id(), bounds)):
+            if a < last or (a == last and a == b):
+                continue
+            last = b
+            if text and (converted := convert(text)) != text:
+                batch.replace(a, b, converted)
+        batch.apply(clear_selection=True)
+
+        # selections cover their converted text, cursors stay at the start
+        # of their word
+        set_selection(
+            v,
+            (
+                (batch.map(a, after=a > b), batch.map(b, after=b >= a))
+                if a != b
+                else (batch.map(a, after=False),) * 2
+                for a, b in regs
+            ),
+        )
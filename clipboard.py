@@ -0,0 +1,342 @@
+import os
+import subprocess
+import threading
+from abc import ABC, abstractmethod
+from queue import Empty, Queue
+from shutil import which
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import sublime
+
+CHUNKSIZE = 1 << 20
+
+Chunks = Callable[[], Iterable[str]]
+
+
+class CopyAborted(Exception):
+    """Raised by the chunks of a streamed copy to drop it, the clipboard
+    then keeps what it had."""
+
+
+class ClipboardBackend(ABC):
+    """
+    The interface every clipboard backend implements. available() is only
+    called while probing, so it may be slow; the other methods are on the
+    hot path of the copy and paste commands.
+    """
+
+    name = ""
+
+    def available(self) -> bool:
+        return True
+
+    def start(self) -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+    @abstractmethod
+    def get(self) -> str:
+        pass
+
+    @abstractmethod
+    def set(self, text: str) -> None:
+        pass
+
+    def set_stream(self, chunks: Chunks) -> None:
+        self.set("".join(chunks()))
+
+
+class MemoryBackend(ClipboardBackend):
+    name = "memory"
+
+    def __init__(self):
+        self.text = ""
+
+    def get(self) -> str:
+        return self.text
+
+    def set(self, text: str) -> None:
+        self.text = text
+
+
+class SublimeBackend(ClipboardBackend):
+    name = "sublime"
+
+    def get(self) -> str:
+        return sublime.get_clipboard()
+
+    def set(self, text: str) -> None:
+        sublime.set_clipboard(text)
+
+
+class ProcessBackend(ClipboardBackend):
+    """
+    Talks to the clipboard through external programs. A long-lived watcher
+    process prints a line for every change of the clipboard, which a reader
+    thread uses to invalidate the cache; the next paste runs read_cmd once
+    and later pastes are served from the cache until the clipboard changes
+    again. Writes are queued to a worker thread that streams them into the
+    writer program in encoded chunks; when copies pile up only the latest
+    one is written. Until the writer is done with a copy, pastes get its
+    text from the cache.
+
+    Without a watch_cmd, or after the watcher dies, every other read runs
+    read_cmd.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        watch_cmd: Optional[List[str]],
+        read_cmd: List[str],
+        write_cmd: List[str],
+        env: Optional[str] = None,
+    ):
+        self.name = name
+        self.env = env
+        self.watch_cmd = watch_cmd
+        self.read_cmd = read_cmd
+        self.write_cmd = write_cmd
+
+        self.lock = threading.Lock()
+        self.cache: Optional[str] = None
+        # bumped whenever the cache is invalidated, so a read that raced
+        # with a change does not fill the cache with the old content
+        self.generation = 0
+        self.watcher: Optional[subprocess.Popen] = None
+        # (generation, chunks) of every copy still to be written
+        self.writes: "Queue[Optional[Tuple[int, Chunks]]]" = Queue()
+        self.writer: Optional[threading.Thread] = None
+
+    def available(self) -> bool:
+        if self.env is not None and not os.environ.get(self.env):
+            return False
+        cmds = (self.watch_cmd, self.read_cmd, self.write_cmd)
+        return all(which(cmd[0]) for cmd in cmds if cmd is not None)
+
+    def start(self) -> None:
+        if self.watcher is None and self.watch_cmd is not None:
+            try:
+                self.watcher = subprocess.Popen(
+                    self.watch_cmd,
+                    stdin=subprocess.DEVNULL,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.DEVNULL,
+                )
+            except OSError:
+                self.watcher = None
+            else:
+                reader = threading.Thread(
+                    target=self._read, args=(self.watcher,), daemon=True
+                )
+                reader.start()
+
+        if self.writer is None:
+            self.writer = threading.Thread(target=self._write, daemon=True)
+            self.writer.start()
+
+    def stop(self) -> None:
+        if (watcher := self.watcher) is not None:
+            self.watcher = None
+            watcher.kill()
+            watcher.wait()
+        if self.writer is not None:
+            self.writer = None
+            self.writes.put(None)
+        with self.lock:
+            self.cache = None
+
+    def get(self) -> str:
+        with self.lock:
+            if self.cache is not None:
+                return self.cache
+            generation = self.generation
+        try:
+            result = subprocess.run(self.read_cmd, stdout=subprocess.PIPE, text=True)
+        except OSError:
+            return ""
+        with self.lock:
+            if self.watcher is not None and self.generation == generation:
+                self.cache = result.stdout
+        return result.stdout
+
+    def set(self, text: str) -> None:
+        with self.lock:
+            self.generation += 1
+            self.cache = text
+            generation = self.generation
+        self._enqueue(
+            generation,
+            lambda: (text[i : i + CHUNKSIZE] for i in range(0, len(text), CHUNKSIZE)),
+        )
+
+    def set_stream(self, chunks: Chunks) -> None:
+        """Writes the text produced by chunks() without holding all of it in
+        memory. The cache is invalidated, the next paste reads the copy."""
+        with self.lock:
+            self.generation += 1
+            self.cache = None
+            generation = self.generation
+        self._enqueue(generation, chunks)
+
+    def _enqueue(self, generation: int, chunks: Chunks) -> None:
+        if self.writer is None:
+            self.start()
+        self.writes.put((generation, chunks))
+
+    def _read(self, watcher: subprocess.Popen) -> None:
+        stdout = watcher.stdout
+        assert stdout is not None
+        while stdout.readline():
+            with self.lock:
+                self.generation += 1
+                self.cache = None
+
+        watcher.wait()
+        with self.lock:
+            if self.watcher is watcher:
+                self.watcher = None
+                self.generation += 1
+                self.cache = None
+
+    def _latest(
+        self, write: Optional[Tuple[int, Chunks]]
+    ) -> Optional[Tuple[int, Chunks]]:
+        while write is not None:
+            try:
+                write = self.writes.get_nowait()
+            except Empty:
+                break
+        return write
+
+    def _write(self) -> None:
+        while (write := self._latest(self.writes.get())) is not None:
+            generation, chunks = write
+            self._copy(chunks)
+            # Without a watcher nothing would report a later change of the
+            # clipboard, so the cache only holds a copy while it is written
+            with self.lock:
+                if self.watcher is None and self.generation == generation:
+                    self.cache = None
+
+    def _copy(self, chunks: Chunks) -> None:
+        try:
+            writer = subprocess.Popen(
+                self.write_cmd,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+        except OSError:
+            return
+
+        stdin = writer.stdin
+        assert stdin is not None
+        try:
+            for chunk in chunks():
+                if not self.writes.empty():
+                    writer.kill()  # a newer copy wins
+                    break
+                stdin.write(chunk.encode())
+            stdin.close()
+        except CopyAborted:
+            writer.kill()
+        except (BrokenPipeError, OSError):
+            pass
+        writer.wait()
+
+
+def wl_clipboard(primary: bool) -> ProcessBackend:
+    flag = ["--primary"] if primary else []
+    return ProcessBackend(
+        "wl-clipboard",
+        ["wl-paste", *flag, "--type", "text", "--watch", "echo"],
+        ["wl-paste", "-n", *flag, "--type", "text"],
+        ["wl-copy", *flag],
+        "WAYLAND_DISPLAY",
+    )
+
+
+def xclip(primary: bool) -> ProcessBackend:
+    selection = ["-selection", "primary" if primary else "clipboard"]
+    return ProcessBackend(
+        "xclip",
+        None,
+        ["xclip", *selection, "-o"],
+        ["xclip", *selection, "-i"],
+        "DISPLAY",
+    )
+
+
+def xsel(primary: bool) -> ProcessBackend:
+    selection = "--primary" if primary else "--clipboard"
+    return ProcessBackend(
+        "xsel",
+        None,
+        ["xsel", selection, "--output"],
+        ["xsel", selection, "--input"],
+        "DISPLAY",
+    )
+
+
+class Clipboard:
+    """
+    The clipboard the commands use. It forwards to the first available
+    backend, probed once and then cached; setting clipboard_backend to a
+    backend name in the preferences puts that backend first.
+    """
+
+    def __init__(self, primary: bool = False):
+        self.primary = primary
+        self.backend: Optional[ClipboardBackend] = None
+
+    def candidates(self) -> List[ClipboardBackend]:
+        backends = [wl_clipboard(self.primary)]
+        if not self.primary:
+            backends.append(SublimeBackend())
+        backends += [xclip(self.primary), xsel(self.primary)]
+        return backends
+
+    def probe(self) -> ClipboardBackend:
+        self.stop()
+        backends: Dict[str, ClipboardBackend] = {}
+        for backend in [*self.candidates(), MemoryBackend()]:
+            backends.setdefault(backend.name, backend)
+
+        settings = sublime.load_settings("Preferences.sublime-settings")
+        preferred = settings.get("clipboard_backend")
+        order = [preferred, *backends] if preferred in backends else backends
+        backend = next(backends[n] for n in order if backends[n].available())
+        backend.start()
+        self.backend = backend
+        return backend
+
+    def stop(self) -> None:
+        if self.backend is not None:
+            self.backend.stop()
+            self.backend = None
+
+    def get(self) -> str:
+        return (self.backend or self.probe()).get()
+
+    def set(self, text: str) -> None:
+        (self.backend or self.probe()).set(text)
+
+    def set_stream(self, chunks: Chunks) -> None:
+        (self.backend or self.probe()).set_stream(chunks)
+
+
+clipboard = Clipboard()
+primary = Clipboard(primary=True)
+
+
+def plugin_loaded():
+    clipboard.probe()
+    primary.probe()
+
+
+def plugin_unloaded():
+    clipboard.stop()
+    primary.stop()
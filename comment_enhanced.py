@@ -3,28 +3,47 @@ import os
 import sublime
 import sublime_plugin
 
+from .base import EditBatch, set_selection, substr_many
 
-def advance_to_first_non_white_space_on_line(view, pt):
-    while True:
-        c = view.substr(pt)
-        if c == " " or c == "\t":
-            pt += 1
-        else:
-            break
+# Selections spanning more lines than this in total are toggled with one
+# batched edit
+BULK_LINES = 1000
 
-    return pt
 
+def line_texts(view, lines):
+    return substr_many(view.id(), ((line.a, line.b) for line in lines))
+
+
+def content_of_lines(view, lines, texts=None):
+    """For each line, the point of its first non-whitespace character and
+    whether it has any content. The last line of the buffer always counts
+    as having content since there is no newline to stop at."""
+    size = view.size()
+    result = []
+    for line, text in zip(lines, texts or line_texts(view, lines)):
+        rest = text.lstrip(" \t")
+        result.append((line.b - len(rest), rest != "" or line.b == size))
+    return result
 
-def has_non_white_space_on_line(view, pt):
-    while True:
-        c = view.substr(pt)
-        if c == " " or c == "\t":
-            pt += 1
-        else:
-            return c != "\n"
+
+# dict from (syntax, scope) to the parsed comment data. The full scope is
+# part of the key as comment tokens may be set for narrower selectors than
+# the language, like JSX inside JavaScript.
+comment_data_cache = {}
+MAX_CACHED_SCOPES = 1000
 
 
 def build_comment_data(view, pt):
+    syntax = view.syntax()
+    key = (syntax.path if syntax else None, view.scope_name(pt))
+    if (data := comment_data_cache.get(key)) is None:
+        if len(comment_data_cache) >= MAX_CACHED_SCOPES:
+            comment_data_cache.clear()
+        data = comment_data_cache[key] = parse_comment_data(view, pt)
+    return data
+
+
+def parse_comment_data(view, pt):
     shell_vars = view.meta_info("shellVariables", pt)
     if not shell_vars:
         return ([], [])
@@ -55,52 +74,74 @@ def build_comment_data(view, pt):
     return (line_comments, block_comments)
 
 
-def min_indent_lines(view, lines):
+class ViewEdits:
+    """Edits the view right away, with the same methods as EditBatch so the
+    comment helpers work in both modes. Positions are taken as they are at
+    the time of the call."""
+
+    def __init__(self, view, edit):
+        self.view = view
+        self.edit = edit
+
+    def insert(self, pt, text):
+        self.view.insert(self.edit, pt, text)
+
+    def erase(self, a, b):
+        self.view.erase(self.edit, sublime.Region(a, b))
+
+
+def min_indent_lines(view, lines, texts=None):
     tab_size = view.settings().get("tab_size", 4)
+    if texts is None:
+        texts = line_texts(view, lines)
 
     # Find the minimum indentation across the lines, accounting for tab size
-    min_indent = None
-    for line in lines:
-        indent = 0
+    prefixes = [text[: len(text) - len(text.lstrip(" \t"))] for text in texts]
+    min_indent = min(
+        (len(p.expandtabs(tab_size)) if "\t" in p else len(p) for p in prefixes),
+        default=0,
+    )
+
+    # Adjust line regions to start at the minimum indentation, indentation
+    # strings repeat a lot so their offsets are computed once
+    offsets = {}
+    for line, prefix in zip(lines, prefixes):
         assert line.a <= line.b
-        for pt in range(line.a, line.b):
-            c = view.substr(pt)
-            if c == " ":
-                indent += 1
-            elif c == "\t":
-                indent += tab_size - (indent % tab_size)
-            else:
-                break
-
-        if min_indent is None or indent < min_indent:
-            min_indent = indent
-
-    # Adjust line regions to start at the minimum indentation
-    for line in lines:
-        indent = 0
-        for pt in range(line.a, line.b):
-            c = view.substr(pt)
-            if c == " ":
-                next_indent = indent + 1
-            elif c == "\t":
-                next_indent = indent + tab_size - (indent % tab_size)
-            else:
-                break
+        if "\t" not in prefix:
+            line.a += min_indent
+            continue
+
+        if (offset := offsets.get(prefix)) is None:
+            offset = offsets[prefix] = min_indent_offset(prefix, min_indent, tab_size)
+        line.a += offset
 
-            # Tabs may cause the indentation to go past the minimum. Take the
-            # previous point instead.
-            if next_indent > min_indent:
-                line.a = pt
-                break
 
-            indent = next_indent
-            if indent == min_indent:
-                line.a = pt + 1
-                break
+def min_indent_offset(prefix, min_indent, tab_size):
+    indent = 0
+    for i, c in enumerate(prefix):
+        if c == " ":
+            next_indent = indent + 1
+        else:
+            next_indent = indent + tab_size - (indent % tab_size)
+
+        # Tabs may cause the indentation to go past the minimum. Take the
+        # previous point instead.
+        if next_indent > min_indent:
+            return i
+
+        indent = next_indent
+        if indent == min_indent:
+            return i + 1
+    return 0
 
 
 class ToggleCommentEnhancedCommand(sublime_plugin.TextCommand):
-    def remove_block_comment(self, view, edit, region):
+    def map_region(self, edits, a, b):
+        if a == b and a in self.carets:
+            return (edits.map(a, after=False) + self.carets[a],) * 2
+        return (edits.map(a), edits.map(b))
+
+    def remove_block_comment(self, view, edits, region):
         scope = view.scope_name(region.begin())
 
         if region.end() > region.begin() + 1:
@@ -132,50 +173,45 @@ class ToggleCommentEnhancedCommand(sublime_plugin.TextCommand):
             )
 
             if view.substr(start_region) == start and view.substr(end_region) == end:
-                # It's faster to erase the start region first
-                view.erase(edit, start_region)
-
-                end_region = sublime.Region(
-                    end_region.begin() - start_region.size(),
-                    end_region.end() - start_region.size(),
-                )
-
-                view.erase(edit, end_region)
+                # Erase the end first so the start keeps its position
+                edits.erase(end_region.a, end_region.b)
+                edits.erase(start_region.a, start_region.b)
                 return True
 
         return False
 
-    def remove_line_comment(self, view, edit, region):
-        start_positions = [
-            advance_to_first_non_white_space_on_line(view, r.begin())
-            for r in view.lines(region)
+    def remove_line_comment(self, view, edits, region):
+        lines = view.lines(region)
+        texts = line_texts(view, lines)
+        starts = [
+            (pos, text[pos - line.a :])
+            for (pos, content), line, text in zip(
+                content_of_lines(view, lines, texts), lines, texts
+            )
+            if content
         ]
-        start_positions = list(
-            filter(lambda p: has_non_white_space_on_line(view, p), start_positions)
-        )
-        if len(start_positions) == 0:
+        if len(starts) == 0:
             return False
 
-        line_comments = build_comment_data(view, start_positions[0])[0]
+        line_comments = build_comment_data(view, starts[0][0])[0]
 
         regions = []
-        for pos in start_positions:
+        for pos, rest in starts:
             found = False
             for start, _ in line_comments:
-                comment_region = sublime.Region(pos, pos + len(start))
-                if view.substr(comment_region) == start:
+                if rest.startswith(start):
                     found = True
-                    regions.append(comment_region)
+                    regions.append(sublime.Region(pos, pos + len(start)))
                     break
             if not found:
                 return False
 
         for region in reversed(regions):
-            view.erase(edit, region)
+            edits.erase(region.a, region.b)
 
         return True
 
-    def block_comment_region(self, view, edit, region, variant):
+    def block_comment_region(self, view, edits, region, variant):
         comment_data = build_comment_data(view, region.begin())
 
         if region.end() > region.begin() + 1:
@@ -187,7 +223,14 @@ class ToggleCommentEnhancedCommand(sublime_plugin.TextCommand):
 
         (start, end, disable_indent) = comment_data[1][variant]
 
-        if region.empty():
+        if region.empty() and isinstance(edits, EditBatch):
+            # Both tokens go in at the same point, the cursor is put between
+            # them once the batch is applied
+            edits.insert(region.a, start)
+            edits.insert(region.a, end)
+            self.carets[region.a] = len(start)
+        elif region.empty():
+            edit = edits.edit
             # Silly buggers to ensure the cursor doesn't end up after the end
             # comment token
             view.replace(edit, sublime.Region(region.end()), "x")
@@ -195,23 +238,24 @@ class ToggleCommentEnhancedCommand(sublime_plugin.TextCommand):
             view.replace(edit, sublime.Region(region.end(), region.end() + 1), "")
             view.insert(edit, region.begin(), start)
         else:
-            view.insert(edit, region.end(), end)
-            view.insert(edit, region.begin(), start)
+            edits.insert(region.end(), end)
+            edits.insert(region.begin(), start)
 
         return True
 
-    def line_comment_region(self, view, edit, region, variant):
+    def line_comment_region(self, view, edits, region, variant):
         lines = view.lines(region)
+        texts = line_texts(view, lines)
 
         # Remove any blank lines from consideration, they make getting the
         # comment start markers to line up challenging
-        non_empty_lines = list(
-            filter(lambda l: has_non_white_space_on_line(view, l.a), lines)
-        )
+        content = content_of_lines(view, lines, texts)
+        non_empty = [(l, t) for l, t, (_, c) in zip(lines, texts, content) if c]
 
         # If all the lines are blank however, just comment away
-        if len(non_empty_lines) != 0:
-            lines = non_empty_lines
+        if len(non_empty) != 0:
+            lines = [l for l, _ in non_empty]
+            texts = [t for _, t in non_empty]
 
         comment_data = build_comment_data(view, lines[0].a)
 
@@ -221,10 +265,10 @@ class ToggleCommentEnhancedCommand(sublime_plugin.TextCommand):
             # block-comment behavior.
             if len(lines) == 1:
                 line = lines[0]
-                if self.remove_block_comment(view, edit, sublime.Region(line.begin())):
+                if self.remove_block_comment(view, edits, sublime.Region(line.begin())):
                     return True
 
-                if self.block_comment_region(view, edit, line, variant):
+                if self.block_comment_region(view, edits, line, variant):
                     return True
 
             return False
@@ -232,34 +276,75 @@ class ToggleCommentEnhancedCommand(sublime_plugin.TextCommand):
         (start, disable_indent) = comment_data[0][variant]
 
         if not disable_indent:
-            min_indent_lines(view, lines)
+            min_indent_lines(view, lines, texts)
 
         for line in reversed(lines):
-            view.insert(edit, line.begin(), start)
+            edits.insert(line.begin(), start)
 
         return True
 
-    def run(self, edit, block=False, next_line=False, variant=0):
+    def is_bulk(self):
+        s = self.view.sel()
+        if len(s) > BULK_LINES:
+            return True
+        rows = 0
+        for r in s:
+            rows += self.view.rowcol(r.end())[0] - self.view.rowcol(r.begin())[0] + 1
+            if rows > BULK_LINES:
+                return True
+        return False
+
+    def run(self, edit, block=False, next_line=False, variant=0, bulk=None):
+        """
+        In bulk mode, the default for selections over BULK_LINES lines in
+        total, every token insertion and removal is computed against the
+        unmodified buffer and applied as one batch. A line is then toggled
+        by the first region on it only, as later regions can't see its
+        edits.
+        """
+        v = self.view
+        if bulk is None:
+            bulk = self.is_bulk()
+        edits = EditBatch(v, edit) if bulk else ViewEdits(v, edit)
+        self.carets = {}
+
+        # In bulk mode the regions are read up front as the view is not
+        # modified until the end
+        regions = [(r.a, r.b) for r in v.sel()] if bulk else v.sel()
+
         sel_posterior = -1
-        for region in self.view.sel():
+        claimed = -1
+        for region in regions:
+            region = sublime.Region(*region) if bulk else region
             sel_prior = sel_posterior
-            sel_posterior, _ = self.view.full_line(region.begin())
+            sel_posterior, _ = v.full_line(region.begin())
 
             if sel_prior == sel_posterior:
                 continue
 
-            if self.remove_block_comment(self.view, edit, region):
+            if bulk:
+                if region.end() <= claimed:
+                    continue
+                if region.begin() <= claimed:
+                    region = sublime.Region(claimed + 1, region.end())
+                claimed = v.line(region.end()).b
+
+            if self.remove_block_comment(v, edits, region):
                 continue
 
-            if self.remove_line_comment(self.view, edit, region):
+            if self.remove_line_comment(v, edits, region):
                 continue
 
             if block:
-                if not self.block_comment_region(self.view, edit, region, variant):
-                    self.line_comment_region(self.view, edit, region, variant)
+                if not self.block_comment_region(v, edits, region, variant):
+                    self.line_comment_region(v, edits, region, variant)
             else:
-                if not self.line_comment_region(self.view, edit, region, variant):
-                    self.block_comment_region(self.view, edit, region, variant)
+                if not self.line_comment_region(v, edits, region, variant):
+                    self.block_comment_region(v, edits, region, variant)
+
+        if bulk:
+            edits.apply(clear_selection=True)
+            set_selection(v, (self.map_region(edits, a, b) for a, b in regions))
 
         if next_line:
             for r in self.view.sel():
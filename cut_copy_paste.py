@@ -1,9 +1,17 @@
 import itertools
-import subprocess
-from typing import List, Tuple
+from bisect import bisect_right
+from typing import Generator, List, Optional, Tuple
 
 import sublime_plugin
-from sublime import DRAW_NO_OUTLINE, Edit, Region, Selection, View
+from sublime import (
+    DRAW_NO_OUTLINE,
+    Edit,
+    Region,
+    Selection,
+    View,
+    set_timeout,
+    status_message,
+)
 from sublime_api import set_timeout_async as set_timeout_async  # pyright: ignore
 from sublime_api import view_add_regions  # pyright: ignore
 from sublime_api import view_cached_substr as ssubstr  # pyright: ignore
@@ -12,27 +20,63 @@ from sublime_api import view_selection_add_point as add_pt  # pyright: ignore
 from sublime_api import view_selection_add_region as add_region  # pyright: ignore
 from sublime_api import view_selection_subtract_region as subtract  # pyright: ignore
 
-BUFFER = []
+from .base import (
+    EditBatch,
+    buffer_chunks,
+    lines_around,
+    set_selection,
+    substr_many,
+)
+from .clipboard import CopyAborted, clipboard
+from .clipboard import primary as primary_clipboard
+from .kill_ring import kill_ring
+
 TIMER = 0
+LARGE_PASTE = 4 * 1024 * 1024
+PASTE_PIECE = 1024 * 1024
 
 
-def setClipboard(buffer):
-    clip = "".join(buffer)
+def setClipboard(clip: str) -> None:
     if clip.isspace():
         return
-    subprocess.run(["wl-copy"], input=clip.encode())
+    clipboard.set(clip)
 
 
 class CopyBufferCommand(sublime_plugin.TextCommand):
+    """
+    Streams the whole buffer to the clipboard from the writer thread. If the
+    buffer changes before the last chunk is read, the stream is dropped and
+    the buffer copied in one go on the UI thread instead.
+    """
+
     def run(self, edit: Edit):
-        vi = self.view.id()
-        text = ssubstr(vi, 0, self.view.size())
-        subprocess.run(["wl-copy"], input=text.encode())
+        v = self.view
+        vi = v.id()
+        size = v.size()
+        change_count = v.change_count()
+
+        def chunks() -> Generator[str, None, None]:
+            for chunk in buffer_chunks(vi, 0, size):
+                if v.change_count() != change_count:
+                    set_timeout(self.copy_now)
+                    raise CopyAborted
+                yield chunk
+
+        clipboard.set_stream(chunks)
+
+    def copy_now(self) -> None:
+        if self.view.is_valid():
+            clipboard.set(self.view.substr(Region(0, self.view.size())))
 
 
 class SmartCopyCommand(sublime_plugin.TextCommand):
     def run(
-        self, edit, whole_line: bool = False, cut: bool = False, append: bool = False
+        self,
+        edit,
+        whole_line: bool = False,
+        cut: bool = False,
+        append: bool = False,
+        register: Optional[str] = None,
     ) -> None:
         v: View = self.view
         vi = v.id()
@@ -59,10 +103,8 @@ class SmartCopyCommand(sublime_plugin.TextCommand):
             lines.add(line.a)
             content.append(line)
 
-        if only_empty_selections := all(r.b == r.a for r in sel):
-            clip = "".join(v.substr(reg) for reg in content)
-        else:
-            clip = "\n".join(v.substr(reg) for reg in content)
+        sep = "" if (only_empty_selections := all(r.b == r.a for r in sel)) else "\n"
+        clip = sep.join(substr_many(vi, ((r.a, r.b) for r in content)))
 
         if cut:
             for reg in reversed(content):
@@ -70,10 +112,7 @@ class SmartCopyCommand(sublime_plugin.TextCommand):
 
         v.show(v.sel()[-1].b, False)
 
-        global BUFFER
-        if not append:
-            BUFFER = []
-        BUFFER.append(clip)
+        text = kill_ring.push(clip, register, append)
 
         global TIMER
         TIMER += 1
@@ -82,7 +121,7 @@ class SmartCopyCommand(sublime_plugin.TextCommand):
             global TIMER
             TIMER -= 1
             if TIMER == 0:
-                setClipboard(BUFFER)
+                setClipboard(text)
 
         set_timeout_async(copyMaybe, 50)
 
@@ -104,17 +143,24 @@ class SmartCopyCommand(sublime_plugin.TextCommand):
             add_pt(vi, pointer_after_action)
 
 
+def get_register(register: Optional[str]) -> Optional[str]:
+    if register is None:
+        return clipboard.get()
+    if (text := kill_ring.get(register)) is None:
+        status_message(f"Register {register} is empty")
+    return text
+
+
 class SmartPasteCutNewlinesAndWhitespaceCommand(sublime_plugin.TextCommand):
-    def run(self, edit: Edit) -> None:
+    def run(self, edit: Edit, register: Optional[str] = None) -> None:
         v: View = self.view
+        if (text := get_register(register)) is None:
+            return
 
         wschar = " " if v.settings().get("translate_tabs_to_spaces") else "\t"
         sels: Selection = v.sel()
 
-        result = subprocess.run(["wl-paste", "-n"], stdout=subprocess.PIPE, text=True)
-        clipboard = result.stdout
-
-        clips = [c.strip() for c in clipboard.splitlines() if c.strip()]
+        clips = [c.strip() for c in text.splitlines() if c.strip()]
         clip_pos: List[Tuple[int, int]] = [(len(clips[-1]), len(clips[-1]) + 1)]
 
         for clip in reversed(clips[:-1]):
@@ -137,17 +183,17 @@ class SmartPasteCutNewlinesAndWhitespaceCommand(sublime_plugin.TextCommand):
 
 
 class SmartPasteCutWhitespaceCommand(sublime_plugin.TextCommand):
-    def run(self, edit: Edit):
+    def run(self, edit: Edit, register: Optional[str] = None):
         v: View = self.view
+        if (text := get_register(register)) is None:
+            return
 
-        result = subprocess.run(["wl-paste", "-n"], stdout=subprocess.PIPE, text=True)
-        clipboard = result.stdout
-
-        stripped_clipboard = clipboard.strip()
-        s: Selection = v.sel()
-        for r in reversed(s):
-            v.erase(edit, r)
-            v.insert(edit, r.begin(), stripped_clipboard)
+        stripped_clipboard = text.strip()
+        regs = [(r.begin(), r.end()) for r in v.sel()]
+        batch = EditBatch(v, edit)
+        [batch.replace(a, b, stripped_clipboard) for a, b in regs]
+        batch.apply(clear_selection=True)
+        set_selection(v, ((pt, pt) for pt in (batch.map(b) for _, b in regs)))
 
 
 def find_indent(
@@ -182,13 +228,128 @@ def find_indent(
         return len(line_content) - len(line_content.lstrip())
 
 
+class LineIndents:
+    """
+    The lines of a set of points and the lines next to them, read with
+    lines_around, so the indentation for every cursor can be looked up
+    without walking the buffer through the API. Searches that run past the
+    fetched lines fall back to find_indent.
+    """
+
+    def __init__(self, v: View, pts: List[int]):
+        self.view = v
+        self.size = v.size()
+        lines = lines_around(v, pts)
+        neighbours = [a - 1 for a, _ in lines if a > 0]
+        neighbours += [a + len(line) + 1 for a, line in lines]
+        known = dict(lines)
+        known.update(lines_around(v, [pt for pt in neighbours if pt <= self.size]))
+        self.starts = sorted(known)
+        self.lines = [known[a] for a in self.starts]
+
+    @staticmethod
+    def width(line: str) -> int:
+        return len(line) - len(line.lstrip())
+
+    def adjacent(self, row: int) -> bool:
+        """Whether the line at row + 1 follows the one at row in the buffer."""
+        return (
+            row + 1 < len(self.starts)
+            and self.starts[row] + len(self.lines[row]) + 1 == self.starts[row + 1]
+        )
+
+    def find(self, region: Region, wschar: str, before: bool = False) -> int:
+        row = bisect_right(self.starts, region.begin()) - 1
+        line = self.lines[row]
+        if line == "":
+            if before:
+                while row > 0 and self.adjacent(row - 1):
+                    row -= 1
+                    if self.lines[row].startswith(wschar):
+                        return self.width(self.lines[row])
+                if self.starts[row] > 1:
+                    return self.fallback(region, wschar, before)
+            else:
+                while self.adjacent(row):
+                    row += 1
+                    if self.lines[row] != "":
+                        return self.width(self.lines[row])
+                if self.starts[row] + len(self.lines[row]) < self.size:
+                    return self.fallback(region, wschar, before)
+            return 0
+
+        if line.isspace():
+            return region.b - self.starts[row]
+
+        if not before and self.adjacent(row) and self.lines[row + 1] != "":
+            line = self.lines[row + 1]
+
+        return self.width(line)
+
+    def fallback(self, region: Region, wschar: str, before: bool) -> int:
+        v = self.view
+        return find_indent(v, v.line(region.begin()), region, wschar, before)
+
+
+def iter_lines(text: str) -> Generator[str, None, None]:
+    """The lines of text one at a time, without their LF or CRLF line ends
+    as with str.splitlines."""
+    start = 0
+    while (end := text.find("\n", start)) != -1:
+        line = text[start:end]
+        yield line[:-1] if line.endswith("\r") else line
+        start = end + 1
+    if start < len(text):
+        line = text[start:]
+        yield line[:-1] if line.endswith("\r") else line
+
+
+def clipboard_layout(text: str) -> Tuple[int, int, int]:
+    """The first content line, the whitespace padding and the indentation of
+    the first content line, computed the same way as SmartPasteCommand does
+    for small clipboards but without a list of lines."""
+    content_line = -1
+    padding = 0
+    init_indent = 0
+    for i, line in enumerate(iter_lines(text)):
+        if i == 0 or content_line == -1 and line and not line.isspace():
+            init_indent = len(line) - len(line.lstrip())
+        if line.isspace():
+            padding += len(line)
+        elif line and content_line == -1:
+            content_line = i
+    return max(content_line, 0), padding, init_indent
+
+
+def reindented_pieces(
+    text: str, buf_indent: int, init_indent: int, wschar: str, indent_same: bool
+) -> Generator[str, None, None]:
+    """Yields the re-indented clipboard in pieces of about PASTE_PIECE
+    characters, so at most one piece exists next to the clipboard."""
+    piece: List[str] = []
+    size = 0
+    indent = buf_indent
+    for line in iter_lines(text):
+        sline = line.lstrip()
+        if not indent_same:
+            indent = buf_indent + len(line) - len(sline) - init_indent
+        piece.extend([wschar * indent, sline, "\n"])
+        size += max(indent, 0) + len(sline) + 1
+        if size >= PASTE_PIECE:
+            yield "".join(piece)
+            piece = []
+            size = 0
+    if piece:
+        yield "".join(piece)
+
+
 class SmartPasteCommand(sublime_plugin.TextCommand):
-    def selections_match_clipboard(self, s: Selection, clips: List[str]) -> bool:
-        if len(clips) == len(s):
+    def selections_match_clipboard(self, s: Selection, count: int) -> bool:
+        if count == len(s):
             return True
         vi = self.view.id()
         # all(not r.empty() for r in s) and
-        return len(clips) == len(set(ssubstr(vi, r.a, r.b) for r in s))
+        return count == len(set(substr_many(vi, ((r.a, r.b) for r in s))))
 
     def run(
         self,
@@ -197,23 +358,27 @@ class SmartPasteCommand(sublime_plugin.TextCommand):
         replace=True,
         indent_same=False,
         primary=False,
+        register: Optional[str] = None,
     ) -> None:
         v: View = self.view
 
         wschar = " " if v.settings().get("translate_tabs_to_spaces") else "\t"
         s: Selection = v.sel()
-        args = ["wl-paste", "-n"]
-
         if primary:
-            args.append("--primary")
-        result = subprocess.run(args, stdout=subprocess.PIPE, text=True)
-
-        clipboard = result.stdout
+            text = primary_clipboard.get()
+        elif (text := get_register(register)) is None:
+            return
 
-        clips = clipboard.splitlines()
         vi = v.id()
 
-        selections_match = self.selections_match_clipboard(s, clips)
+        # Above the threshold the clipboard is never split into a list of
+        # lines unless every cursor gets a line of its own.
+        large = len(text) > v.settings().get("large_paste_threshold", LARGE_PASTE)
+        clips = [] if large else text.splitlines()
+        count = text.count("\n") + (not text.endswith("\n")) if large else len(clips)
+        if selections_match := self.selections_match_clipboard(s, count):
+            clips = text.splitlines() if large else clips
+            large = False
         if replace:
             [erase(vi, edit.edit_token, r) for r in s if r.a != r.b]
             # return
@@ -223,8 +388,8 @@ class SmartPasteCommand(sublime_plugin.TextCommand):
             else:
                 [(subtract(vi, r.begin(), r.end()), add_pt(vi, r.end())) for r in s]
 
-        if not clipboard.endswith("\n"):
-            clipboard_iterator = clips if selections_match else [clipboard]
+        if not text.endswith("\n"):
+            clipboard_iterator = clips if selections_match else [text]
             for r, cliplet in zip(s, itertools.cycle(clipboard_iterator)):
                 insert_pos = r.begin() if before else r.end()
                 v.insert(edit, insert_pos, cliplet)
@@ -232,16 +397,31 @@ class SmartPasteCommand(sublime_plugin.TextCommand):
             return
 
         stripped_lines = [line.lstrip() for line in clips]
+        line_indents = LineIndents(v, [r.begin() for r in s])
+        indents = [line_indents.find(r, wschar, before) for r in s]
         if selections_match:
-            for r, cliplet in zip(s, itertools.cycle(stripped_lines)):
+            for r, cliplet, indent in zip(s, itertools.cycle(stripped_lines), indents):
                 line_reg = v.line(r.begin())
                 insert_pos = line_reg.a if before else v.full_line(r.begin()).b
-                indent = find_indent(v, line_reg, r, wschar, before)
                 insert_string = wschar * indent + cliplet + "\n"
 
                 s.subtract(r)
                 v.insert(edit, insert_pos, insert_string)
                 add_pt(vi, insert_pos + indent)
+        elif large:
+            content_line, padding, init_indent = clipboard_layout(text)
+            for r, buf_indent in zip(s, indents):
+                line_reg = v.line(r.begin())
+                insert_pos = line_reg.a if before else v.full_line(r.begin()).b
+                pieces = reindented_pieces(
+                    text, buf_indent, init_indent, wschar, indent_same
+                )
+
+                s.subtract(r)
+                pos = insert_pos
+                for piece in pieces:
+                    pos += v.insert(edit, pos, piece)
+                add_pt(vi, insert_pos + buf_indent + content_line + padding)
         else:
             content_line = -1
             padding = 0
@@ -256,10 +436,10 @@ class SmartPasteCommand(sublime_plugin.TextCommand):
                 content_line = 0
 
             init_indent = len(clips[content_line]) - len(stripped_lines[content_line])
-            for r in s:
+            for r, buf_indent in zip(s, indents):
                 line_reg = v.line(r.begin())
                 insert_pos = line_reg.a if before else v.full_line(r.begin()).b
-                buf_indent = indent = find_indent(v, line_reg, r, wschar, before)
+                indent = buf_indent
                 strings = []
                 for lline, sline in zip(line_lengths, stripped_lines):
                     if not indent_same:
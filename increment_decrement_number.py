@@ -1,95 +1,230 @@
 import re
+import time
+from bisect import bisect_right
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple, Union
 
 import sublime_plugin
-from sublime import Edit, Region, set_timeout_async
+from sublime import Edit, View, set_timeout
+
+from .base import EditBatch, lines_around, set_selection, substr_many
+
+# A number with an optional sign: hex, binary, decimal or float, digits may
+# be separated by single underscores. Dotted runs like versions or addresses
+# are not floats, each of their digit runs is a number of its own.
+NUMBER = re.compile(
+    r"(-?)(0[xX][0-9a-fA-F](?:_?[0-9a-fA-F])*"
+    r"|0[bB][01](?:_?[01])*"
+    r"|(?<![.\d])\d(?:_?\d)*\.\d(?:_?\d)*(?!\.?\d)"
+    r"|\d(?:_?\d)*)"
+)
+
+# How far around a cursor to look for the ends of its line in the first read
+LINE_WINDOW = 1024
+
+# (digits start, end, start including the sign) of every number on a line
+Span = Tuple[int, int, int]
+
+# dict from the hash of a line to its length and the numbers on it, so the
+# lines themselves are not kept alive; the length guards against collisions
+number_spans: Dict[int, Tuple[int, List[Span]]] = {}
+MAX_CACHED_LINES = 10_000
+
+
+def spans_of_line(line: str) -> List[Span]:
+    key = hash(line)
+    if (cached := number_spans.get(key)) is not None and cached[0] == len(line):
+        return cached[1]
+    if len(number_spans) >= MAX_CACHED_LINES:
+        number_spans.clear()
+    spans = [(m.start(2), m.end(), m.start()) for m in NUMBER.finditer(line)]
+    number_spans[key] = (len(line), spans)
+    return spans
+
+
+def nearest_span(spans: List[Span], column: int) -> Optional[Tuple[int, int]]:
+    """The number at column, or else the closest one; ties go left."""
+    i = bisect_right(spans, (column, float("inf")))
+    left = spans[i - 1] if i > 0 else None
+    right = spans[i] if i < len(spans) else None
+    if left is not None and (
+        column < left[1] or right is None or column - left[1] < right[0] - column
+    ):
+        return left[2], left[1]
+    if right is not None:
+        return right[2], right[1]
+    return None
+
+
+def group_digits(digits: str, size: int) -> str:
+    head = len(digits) % size or size
+    parts = [digits[:head]]
+    parts += [digits[i : i + size] for i in range(head, len(digits), size)]
+    return "_".join(parts)
+
+
+def parse_number(text: str) -> Optional[Tuple[Union[int, Decimal], str]]:
+    """The value of text and the format to write a new value in."""
+    if (m := NUMBER.fullmatch(text)) is None:
+        return None
+    sign, body = m.groups()
+    prefix = body[:2].lower()
+    value: Union[int, Decimal]
+    if prefix in ("0x", "0b"):
+        value = int(body[2:].replace("_", ""), 16 if prefix == "0x" else 2)
+    elif "." in body:
+        value = Decimal(body.replace("_", ""))
+    else:
+        value = int(body.replace("_", ""))
+    return (-value if sign else value), body
+
+
+def format_number(value: Union[int, Decimal], body: str) -> str:
+    sign = "-" if value < 0 else ""
+    value = abs(value)
+    underscores = "_" in body
+    prefix = body[:2].lower()
+    if prefix in ("0x", "0b"):
+        old = body[2:].replace("_", "")
+        digits = format(value, "x" if prefix == "0x" else "b").zfill(len(old))
+        if any(c.isupper() for c in old):
+            digits = digits.upper()
+        if underscores:
+            digits = group_digits(digits, 4)
+        return sign + body[:2] + digits
+
+    if isinstance(value, Decimal):
+        whole, _, fraction = format(value, "f").partition(".")
+        if underscores:
+            whole = group_digits(whole, 3)
+        return f"{sign}{whole}.{fraction}"
+
+    digits = str(value)
+    return sign + (group_digits(digits, 3) if underscores else digits)
+
+
+class SaveScheduler:
+    """
+    Coalesces save requests per view. A save runs once no request came in
+    for the quiet period, but at the latest max_delay after the first of
+    the requests it answers, so holding a key down still saves now and
+    then. requested, saved and avoided count what happened so far.
+
+    Saves are scheduled on the UI thread, the thread requests come from, so
+    pending is never touched by two threads at once.
+    """
+
+    def __init__(self):
+        # dict from view id to (time of the first pending request, generation)
+        self.pending: Dict[int, Tuple[float, int]] = {}
+        self.requested = 0
+        self.saved = 0
+
+    @property
+    def avoided(self) -> int:
+        return self.requested - self.saved - len(self.pending)
+
+    def request(self, view: View, quiet: float, max_delay: float) -> None:
+        self.requested += 1
+        vid = view.id()
+        now = time.monotonic()
+        first, generation = self.pending.get(vid, (now, 0))
+        generation += 1
+        self.pending[vid] = (first, generation)
+
+        delay = max(0.0, min(quiet, first + max_delay - now))
+        set_timeout(lambda: self.save(vid, generation), int(delay * 1000))
+
+    def save(self, vid: int, generation: int) -> None:
+        # a later request has a timer of its own
+        if self.pending.get(vid, (0, -1))[1] != generation:
+            return
+        del self.pending[vid]
+        if (v := View(vid)).is_valid():
+            v.run_command("save")
+            self.saved += 1
+
+
+save_scheduler = SaveScheduler()
 
 
 class NumberCommand(sublime_plugin.TextCommand):
-    def op(self, value: int) -> int:
+    def op(self, value: int, step: int) -> int:
         return value
 
-    def save(self):
-        self.view.run_command("save")
-
-    def find_pt(
-        self, line: str, start: int, stop: int, forward: bool, digit: bool
-    ) -> int:
-        for i in range(start, stop, 1 if forward else -1):
-            if line[i].isdigit() == digit:
-                return i
-        return stop
-
-    def run(self, edit: Edit) -> None:
+    def run(self, edit: Edit, count: int = 1, sequence: bool = False) -> None:
+        """
+        Changes the number under or next to each cursor by count. With
+        sequence the n-th number down the cursors changes by n * count,
+        like g ctrl-a in Vim.
+        """
         buf = self.view
-        selection = buf.sel()
-        for region in reversed(selection):
+        vid = buf.id()
+        regions = list(buf.sel())
+        texts = substr_many(vid, ((r.a, r.b) for r in regions))
+        lines = lines_around(buf, (r.b for r in regions), LINE_WINDOW)
+
+        regs = []
+        for region, mystr, (line_start, line) in zip(regions, texts, lines):
             if not region.empty():
-                mystr = buf.substr(region)
-                if mystr.isdigit() or mystr.startswith("-") and mystr[1:].isdigit():
+                if NUMBER.fullmatch(mystr):
+                    regs.append((region.a, region.b))
                     continue
                 if reg_list := [
-                    Region(m.start() + region.begin(), m.end() + region.begin())
-                    for m in re.finditer(r"-?\d+", buf.substr(region))
+                    (m.start() + region.begin(), m.end() + region.begin())
+                    for m in NUMBER.finditer(mystr)
                 ]:
-                    selection.subtract(region)
-                    selection.add_all(reg_list)  # pyright:ignore
+                    regs += reg_list
                     continue
 
-            if not (line := buf.substr(buf.full_line(region.b))):
+            column = region.b - line_start
+            if (span := nearest_span(spans_of_line(line), column)) is None:
+                regs.append((region.a, region.b))
                 continue
-
-            line_no, column = buf.rowcol(region.b)
-
-            left_end = self.find_pt(line, column, -1, False, True)
-            left_begin = self.find_pt(line, left_end, -1, False, False)
-
-            right_begin = self.find_pt(line, column, len(line), True, True)
-            right_end = self.find_pt(line, right_begin, len(line), True, False)
-
-            if left_begin == left_end and right_begin == right_end:
+            start, end = span
+            # A cursor on the fraction of a float changes just the fraction
+            if 0 <= (dot := line.find(".", start, end)) < column:
+                start = dot + 1
+            regs.append((line_start + start, line_start + end))
+
+        # Cursors next to the same number select it once
+        bounds = {}
+        for a, b in regs:
+            bounds.setdefault((min(a, b), max(a, b)), (a, b))
+        regs = [bounds[key] for key in sorted(bounds)]
+
+        batch = EditBatch(buf, edit)
+        step = count
+        for (a, b), text in zip(regs, substr_many(vid, regs)):
+            if (number := parse_number(text)) is None:
                 continue
-
-            if left_end == right_begin:
-                left_pos = left_begin + 1
-                right_pos = right_end
-            elif left_begin == left_end == -1 and right_begin != right_end:
-                left_pos = right_begin
-                right_pos = right_end
-            elif right_begin == right_end == len(line) and left_begin != left_end:
-                left_pos = left_begin + 1
-                right_pos = left_end + 1
-
-            elif right_begin - column < column - left_end:
-                left_pos = right_begin
-                right_pos = right_end
-            else:
-                left_pos = left_begin + 1
-                right_pos = left_end + 1
-
-            if left_pos >= 1 and line[left_pos - 1] == "-":
-                left_pos -= 1
-
-            pos_begin = buf.text_point(line_no, left_pos)
-            pos_end = buf.text_point(line_no, right_pos)
-            selection.subtract(region)
-            selection.add(Region(pos_begin, pos_end))
-
-        for region in selection:
-            try:
-                value = int(buf.substr(region))
-                buf.replace(edit, region, str(self.op(value)))
-            except ValueError:
-                pass
-
-        if buf.settings().get(key="save_after_number_change", default=False):
-            set_timeout_async(self.save, 0)
+            value, body = number
+            batch.replace(a, b, format_number(self.op(value, step), body))
+            if sequence:
+                step += count
+        batch.apply(clear_selection=True)
+        set_selection(
+            buf,
+            (
+                (batch.map(a, after=a > b), batch.map(b, after=b >= a))
+                for a, b in regs
+            ),
+        )
+
+        settings = buf.settings()
+        if settings.get(key="save_after_number_change", default=False):
+            save_scheduler.request(
+                buf,
+                settings.get("save_after_number_change_quiet", 0.5),
+                settings.get("save_after_number_change_max_delay", 2.0),
+            )
 
 
 class IncrementCommand(NumberCommand):
-    def op(self, value: int) -> int:
-        return value + 1
+    def op(self, value: int, step: int) -> int:
+        return value + step
 
 
 class DecrementCommand(NumberCommand):
-    def op(self, value: int) -> int:
-        return value - 1
+    def op(self, value: int, step: int) -> int:
+        return value - step
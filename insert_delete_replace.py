@@ -4,11 +4,11 @@ import sublime
 import sublime_plugin
 from sublime import Edit, Region, Selection, View, active_window
 from sublime_api import view_add_regions  # pyright: ignore
-from sublime_api import view_erase  # pyright:ignore
-from sublime_api import view_selection_add_point as add_pt  # pyright: ignore
 from sublime_api import view_selection_add_region as add_reg  # pyright: ignore
 from sublime_plugin import WindowCommand
 
+from .base import EditBatch, lines_around, normalize_intervals, set_selection
+
 
 class CommandModeCommand(WindowCommand):
     def run(self) -> None:
@@ -23,30 +23,42 @@ class CommandModeCommand(WindowCommand):
 
 class DeleteSingleCharCommand(sublime_plugin.TextCommand):
     def run(self, e: Edit, forward=False) -> None:
-        s = self.view.sel()
-        vi = self.view.id()
+        v = self.view
+        s = v.sel()
+        size = v.size()
         pt = 1 if forward else -1
-        [view_erase(vi, e.edit_token, Region(r.b, r.b + pt)) for r in s]
+        regs = [(r.a, r.b) for r in s]
+        batch = EditBatch(v, e)
+        [batch.erase(b, min(max(b + pt, 0), size)) for _, b in regs]
+        batch.apply(clear_selection=True)
+        set_selection(v, ((batch.map(a), batch.map(b)) for a, b in regs))
 
 
 class SmartDeleteLineCommand(sublime_plugin.TextCommand):
     def run(self, edit: Edit) -> None:
         buf = self.view
-        for region in reversed(buf.sel()):
-            if region.empty():
-                if region.a == buf.size():
-                    reg = buf.full_line(region.begin() - 1)
-                else:
-                    reg = buf.full_line(region.begin())
-            else:
-                begin_line, _ = buf.rowcol(region.begin())
-                end_line, col = buf.rowcol(region.end())
-                if col != 0:
-                    end_line += 1
-                reg_beg = buf.text_point(begin_line, 0)
-                reg_end = buf.text_point(end_line, 0) - 1
-                reg = Region(reg_beg, reg_end + 1)
-            buf.erase(edit, reg)
+        size = buf.size()
+        regs = [(r.a, r.b) for r in buf.sel()]
+
+        # An empty selection deletes its full line, a non-empty one the lines
+        # it touches, except the line it ends at when it ends at column 0
+        begins = [min(a, b) if a != b or a < size else a - 1 for a, b in regs]
+        ends = [max(a, b) if a != b else pt for (a, b), pt in zip(regs, begins)]
+        lines = lines_around(buf, begins + ends)
+        spans = []
+        for (a, b), (start, _), (end_start, end_line) in zip(
+            regs, lines, lines[len(regs) :]
+        ):
+            end = end_start + len(end_line) + 1
+            if a != b and max(a, b) == end_start:
+                end = end_start
+            spans.append((start, min(end, size)))
+
+        batch = EditBatch(buf, edit)
+        for a, b in normalize_intervals(spans):
+            batch.erase(a, b)
+        batch.apply(clear_selection=True)
+        set_selection(buf, ((batch.map(a), batch.map(b)) for a, b in regs))
 
 
 class CallbackCommand(sublime_plugin.TextCommand):
@@ -60,19 +72,11 @@ class InsertModeCommand(sublime_plugin.TextCommand):
         v = self.view
 
         if (multiplier := self.view.settings().get("multiplier")) is not None:
-            if multiplier == 1:
-                v.run_command("upper_case")
-            elif multiplier == 2:
-                v.run_command("lower_case")
-            elif multiplier == 3:
-                v.run_command("title_case")
-            elif multiplier == 4:
-                v.run_command("convert_to_snake")
-            elif multiplier == 5:
-                v.run_command("convert_to_pascal")
-            else:
+            cases = ["upper", "lower", "title", "snake", "pascal", "camel", "kebab"]
+            if not 1 <= multiplier <= len(cases):
                 return False
 
+            v.run_command("change_case", {"case": cases[multiplier - 1]})
             return True
         return False
 
@@ -161,18 +165,30 @@ class InsertBeforeOrAfterCommand(sublime_plugin.TextCommand):
 class InsertSpaceCommand(sublime_plugin.TextCommand):
     def run(self, edit: Edit):
         view: View = self.view
-        vi = view.id()
-        for r in view.sel():
-            view.sel().subtract(r)
-            view.insert(edit, r.b, " ")
-            add_pt(vi, r.b if r.b < r.a else r.b + 1, 0.0)
+        regs = [(r.a, r.b) for r in view.sel()]
+        batch = EditBatch(view, edit)
+        [batch.insert(b, " ") for _, b in regs]
+        batch.apply(clear_selection=True)
+        pts = (batch.map(b, after=b >= a) for a, b in regs)
+        set_selection(view, ((pt, pt) for pt in pts))
 
 
 class ReplaceSingleChar(sublime_plugin.TextCommand):
     def run(self, edit, character):
         view: View = self.view
-        for r in view.sel():
-            if r.empty():
-                view.replace(edit, Region(r.a, r.a + 1), character)
+        size = view.size()
+        regs = [(r.a, r.b) for r in view.sel()]
+        batch = EditBatch(view, edit)
+        for a, b in regs:
+            if a == b:
+                batch.replace(a, min(a + 1, size), character)
             else:
-                view.replace(edit, r, character)
+                batch.replace(a, b, character)
+        batch.apply(clear_selection=True)
+
+        new_regs = []
+        for a, b in regs:
+            start = batch.map(min(a, b), after=False)
+            end = start if a == b else start + len(character)
+            new_regs.append((end, start) if a > b else (start, end))
+        set_selection(view, new_regs)
@@ -0,0 +1,67 @@
+import sys
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+MAX_BYTES = 64 * 1024 * 1024
+NUMBERED = 10
+
+
+def _nbytes(parts: List[str]) -> int:
+    return sum(sys.getsizeof(p) for p in parts)
+
+
+class KillRing:
+    """
+    Numbered registers "0" (most recent) to "9" that shift on every copy,
+    and named registers that are only written when asked for. Entries are
+    lists of parts so appending does not copy what is already stored. When
+    the total size exceeds max_bytes the oldest numbered entries are
+    dropped first, then the named ones.
+    """
+
+    def __init__(self, max_bytes: int = MAX_BYTES, numbered: int = NUMBERED):
+        self.max_bytes = max_bytes
+        self.numbered: Deque[List[str]] = deque(maxlen=numbered)
+        self.named: Dict[str, List[str]] = {}
+
+    def push(
+        self, text: str, register: Optional[str] = None, append: bool = False
+    ) -> str:
+        """Stores text and returns the full content of the written entry."""
+        named = register is not None and not register.isdigit()
+
+        if named:
+            entry = self.named.get(register, []) if append else []  # pyright: ignore
+            self.named[register] = entry  # pyright: ignore
+        elif append and self.numbered:
+            entry = self.numbered[0]
+        else:
+            entry = []
+            self.numbered.appendleft(entry)
+
+        entry.append(text)
+        self._evict()
+        return "".join(entry)
+
+    def get(self, register: str = "0") -> Optional[str]:
+        if register.isdigit():
+            index = int(register)
+            if index >= len(self.numbered):
+                return None
+            entry = self.numbered[index]
+        elif (entry := self.named.get(register)) is None:
+            return None
+        return "".join(entry)
+
+    def _evict(self) -> None:
+        total = sum(_nbytes(e) for e in self.numbered)
+        total += sum(_nbytes(e) for e in self.named.values())
+        while total > self.max_bytes and len(self.numbered) > 1:
+            total -= _nbytes(self.numbered.pop())
+        for name in list(self.named):
+            if total <= self.max_bytes:
+                break
+            total -= _nbytes(self.named.pop(name))
+
+
+kill_ring = KillRing()
@@ -7,6 +7,8 @@ from sublime_api import view_find  # pyright: ignore
 from sublime_api import view_selection_add_region as add_region  # pyright: ignore
 from sublime_plugin import TextCommand, TextInputHandler, WindowCommand
 
+from .base import EditBatch, lines_around, set_selection, substr_many
+
 
 class ClearSelectionCommand(sublime_plugin.TextCommand):
     def run(self, _, forward: Optional[bool] = None, after=True) -> None:
@@ -30,6 +32,72 @@ class CreateRegionFromSelectionsCommand(sublime_plugin.TextCommand):
         sel.add(Region(line_beg, line_end))
 
 
+class DuplicateWithMultipleCursorsCommand(sublime_plugin.TextCommand):
+    """
+    With only cursors, duplicates the block of lines from the first cursor
+    to the last count times and puts a cursor at the first non-blank
+    character of every line of the original block. Otherwise every
+    selection, or the line of every cursor, is duplicated in place like
+    duplicate_line. Either way the text is written in one edit.
+    """
+
+    def run(self, edit: Edit, count: int = 1) -> None:
+        v = self.view
+        regs = [(r.a, r.b) for r in v.sel()]
+        if not regs:
+            return
+
+        if all(a == b for a, b in regs):
+            self.duplicate_block(edit, regs[0][0], regs[-1][0], count)
+        else:
+            self.duplicate_each(edit, regs, count)
+
+    def duplicate_block(self, edit: Edit, first: int, last: int, count: int):
+        v = self.view
+        size = v.size()
+        (start, _), (last_start, last_line) = lines_around(v, (first, last))
+        end = min(last_start + len(last_line) + 1, size)
+        block = substr(v.id(), start, end)
+        copy = block if block.endswith("\n") else block + "\n"
+
+        batch = EditBatch(v, edit)
+        batch.insert(start, copy * count)
+        batch.apply(clear_selection=True)
+
+        cursors = []
+        line_start = start + len(copy) * count
+        for line in copy[:-1].split("\n"):
+            cursors.append(line_start + len(line) - len(line.lstrip(" \t")))
+            line_start += len(line) + 1
+        set_selection(v, ((pt, pt) for pt in cursors))
+
+    def duplicate_each(self, edit: Edit, regs, count: int):
+        v = self.view
+        size = v.size()
+        cursors = [a for a, b in regs if a == b]
+        line_spans = {
+            pt: (start, min(start + len(line) + 1, size))
+            for pt, (start, line) in zip(cursors, lines_around(v, cursors))
+        }
+        lines = set(line_spans.values())
+        spans = [
+            line_spans[a] if a == b else (min(a, b), max(a, b)) for a, b in regs
+        ]
+
+        batch = EditBatch(v, edit)
+        seen = set()
+        for span, text in zip(spans, substr_many(v.id(), spans)):
+            if span in seen:
+                continue
+            seen.add(span)
+            # the last line has no newline of its own to copy
+            if span in lines and not text.endswith("\n"):
+                text += "\n"
+            batch.insert(span[0], text * count)
+        batch.apply(clear_selection=True)
+        set_selection(v, ((batch.map(a), batch.map(b)) for a, b in regs))
+
+
 class PoorMansDebuggingCommand(sublime_plugin.TextCommand):
     regex = r"[-<>\w]+"
 
@@ -2,23 +2,45 @@ import re
 import time
 
 import sublime_plugin
-from sublime import Region
+from sublime import Edit, Region
 from sublime_api import view_selection_add_point as add_point  # pyright: ignore
 from sublime_api import view_selection_add_region as add_region  # pyright: ignore
 from sublime_api import view_show_point as show_point  # pyright: ignore
 from sublime_plugin import TextCommand
 
-from .base import buffer_slice
+from .base import EditBatch, buffer_slice, set_selection
 
 then = time.time()
 
 normrgx = re.compile(r"[-\w]+")
 wholergx = re.compile(r"\S+")
 
+# Parts of camelCase, PascalCase, ACRONYMS, snake_case and digits, with
+# the underscores before them. buffer_slice matches backward searches
+# against the reversed buffer, hence the mirrored pattern.
+subword_forward = re.compile(
+    r"_*(?:[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+|[^\W\d_]+|[^\w\s]+)"
+)
+subword_backward = re.compile(
+    r"_*(?:[a-z]+[A-Z]?|[A-Z]+|\d+|[^\W\d_]+|[^\w\s]+)"
+)
+
+
+def word_pattern(forward: bool, whole_words: bool, subwords: bool):
+    if subwords:
+        return subword_forward if forward else subword_backward
+    return wholergx if whole_words else normrgx
+
 
 class NavigateWordCommand(TextCommand):
     def run(
-        self, _, forward: bool = True, whole_words: bool = False, extend: bool = False
+        self,
+        _,
+        forward: bool = True,
+        whole_words: bool = False,
+        extend: bool = False,
+        subwords: bool = False,
+        count: int = 1,
     ):
         v = self.view
         s = v.sel()
@@ -27,26 +49,34 @@ class NavigateWordCommand(TextCommand):
 
         vid = v.id()
         pts = []
-        rgx = wholergx if whole_words else normrgx
+        rgx = word_pattern(forward, whole_words, subwords)
 
         bufind = buffer_slice(v, forward)
         bufind.send(None)
         for a, b in s if forward else reversed(s):
-            mend = b
-            while match := bufind.send((mend, rgx)):
-                mstart, mend = match
-                if mstart == b and (mend == a or (extend and forward is (a > mend))):
-                    continue
-
-                shrink = a != b and forward is (a > b)
-                if extend:
-                    a = b if shrink and (forward is (mstart > a) or b == mstart) else a
-                    b = mstart if shrink and a != b else mend
-                else:
-                    a = mstart if b != mstart or shrink else a
-                    b = mend
-
-                break
+            # each step continues the scan where the previous one stopped
+            for _ in range(count):
+                mend = b
+                while match := bufind.send((mend, rgx)):
+                    mstart, mend = match
+                    if mstart == b and (
+                        mend == a or (extend and forward is (a > mend))
+                    ):
+                        continue
+
+                    shrink = a != b and forward is (a > b)
+                    if extend:
+                        a = (
+                            b
+                            if shrink and (forward is (mstart > a) or b == mstart)
+                            else a
+                        )
+                        b = mstart if shrink and a != b else mend
+                    else:
+                        a = mstart if b != mstart or shrink else a
+                        b = mend
+
+                    break
             pts.append((a, b))
 
         s.clear()
@@ -55,6 +85,31 @@ class NavigateWordCommand(TextCommand):
         show_point(vid, s[-1 if forward else 0].b, False, False, False)
 
 
+class DeleteSubwordCommand(TextCommand):
+    """Deletes from every cursor to the end (or start) of the next subword,
+    and non-empty selections as they are, in one batched edit."""
+
+    def run(self, edit: Edit, forward: bool = True):
+        v = self.view
+        s = v.sel()
+        if len(s) < 1:
+            return
+
+        regs = [(r.a, r.b) for r in s]
+        rgx = subword_forward if forward else subword_backward
+        bufind = buffer_slice(v, forward, True)
+        bufind.send(None)
+        batch = EditBatch(v, edit)
+        for a, b in regs if forward else reversed(regs):
+            if a == b:
+                _, b = bufind.send((a, rgx))
+            batch.erase(a, b)
+
+        batch.apply(clear_selection=True)
+        set_selection(v, ((batch.map(a), batch.map(a)) for a, _ in regs))
+        show_point(v.id(), s[-1 if forward else 0].b, False, False, False)
+
+
 class NavigateParagraphCommand(TextCommand):
     forward = re.compile(r"(\n[\t ]*){2,}")
     backward = re.compile(r"\S(?=[\t ]*\n\n)")
@@ -81,7 +136,7 @@ sels = set()
 class LineOrParagraphCommand(NavigateParagraphCommand):
     backpat = re.compile(r"\S\s*(\n|\Z)")
 
-    def run(self, _, forward: bool = True):
+    def run(self, _, forward: bool = True, count: int = 1):
         v = self.view
         s = v.sel()
         global sels
@@ -95,6 +150,8 @@ class LineOrParagraphCommand(NavigateParagraphCommand):
             any(r.a != r.b for r in s) or now - then >= 1 or bool(sels - current_sels)
         )
 
+        # a count always moves by paragraphs
+        check_lines = check_lines and count == 1
         if check_lines:
             if forward:
                 regs = [(r.begin(), v.line(r.b).b, r.b) for r in s]
@@ -109,8 +166,11 @@ class LineOrParagraphCommand(NavigateParagraphCommand):
 
         if not check_lines:
             pattern = self.forward if forward else self.backward
-            sel = s if forward else reversed(s)
-            regs = [bufind.send((b - 1, pattern)) for a, b in sel]
+            regs = []
+            for a, b in s if forward else reversed(s):
+                for _ in range(count):
+                    a, b = bufind.send((b - 1, pattern))
+                regs.append((a, b))
             then = now
 
         sels = {b for (a, b, *_) in regs}
@@ -0,0 +1,139 @@
+from array import array
+from typing import Dict, List, Optional, Set, Tuple
+
+import sublime_plugin
+from sublime import View, status_message
+from sublime_api import view_selection_add_region as add_region  # pyright: ignore
+from sublime_api import view_show_point as show_point  # pyright: ignore
+from sublime_plugin import TextCommand
+
+MAX_BYTES = 8 * 1024 * 1024
+
+Regions = Set[Tuple[int, int]]
+
+
+def _pack(regions: Regions) -> array:
+    flat = array("q")
+    for a, b in regions:
+        flat.append(a)
+        flat.append(b)
+    return flat
+
+
+def _unpack(flat: array) -> Regions:
+    return set(zip(flat[::2], flat[1::2]))
+
+
+class SelectionHistory:
+    """
+    Stores the selection changes of a view as deltas against the previous
+    selection. Each step is a pair of flat int arrays with the regions that
+    were added and removed, so a step costs memory proportional to what
+    changed, not to the number of cursors.
+    """
+
+    def __init__(self):
+        # A list of (added, removed) arrays
+        self.steps: List[Tuple[array, array]] = []
+        # Number of steps currently applied, steps after it can be redone
+        self.position = 0
+        # The selection the last step leads to
+        self.current: Optional[Regions] = None
+        self.nbytes = 0
+
+    def reset(self) -> None:
+        self.steps = []
+        self.position = 0
+        self.current = None
+        self.nbytes = 0
+
+    def push(self, selection: Regions, max_bytes: int) -> None:
+        if self.current is None:
+            self.current = selection
+            return
+
+        added = selection - self.current
+        removed = self.current - selection
+        if not added and not removed:
+            return
+
+        for step in self.steps[self.position :]:
+            self.nbytes -= self._size(step)
+        del self.steps[self.position :]
+
+        step = (_pack(added), _pack(removed))
+        self.steps.append(step)
+        self.nbytes += self._size(step)
+        self.current = selection
+
+        while self.nbytes > max_bytes and len(self.steps) > 1:
+            self.nbytes -= self._size(self.steps.pop(0))
+        self.position = len(self.steps)
+
+    def undo(self) -> Optional[Regions]:
+        if self.position == 0 or self.current is None:
+            return None
+        self.position -= 1
+        added, removed = self.steps[self.position]
+        self.current = (self.current - _unpack(added)) | _unpack(removed)
+        return self.current
+
+    def redo(self) -> Optional[Regions]:
+        if self.position == len(self.steps) or self.current is None:
+            return None
+        added, removed = self.steps[self.position]
+        self.position += 1
+        self.current = (self.current - _unpack(removed)) | _unpack(added)
+        return self.current
+
+    @staticmethod
+    def _size(step: Tuple[array, array]) -> int:
+        added, removed = step
+        return (len(added) + len(removed)) * added.itemsize
+
+
+# dict from view id to SelectionHistory
+selection_history: Dict[int, SelectionHistory] = {}
+
+
+def _history_for_view(view: View) -> SelectionHistory:
+    return selection_history.setdefault(view.id(), SelectionHistory())
+
+
+class SelectionHistoryListener(sublime_plugin.ViewEventListener):
+    @classmethod
+    def applies_to_primary_view_only(cls) -> bool:
+        return False
+
+    def on_selection_modified(self) -> None:
+        v = self.view
+        if v.element() is not None:
+            return
+
+        max_bytes = v.settings().get("selection_history_max_bytes", MAX_BYTES)
+        _history_for_view(v).push({(r.a, r.b) for r in v.sel()}, max_bytes)
+
+    def on_modified(self) -> None:
+        # offsets in the stored deltas do not follow edits
+        if (history := selection_history.get(self.view.id())) is not None:
+            history.reset()
+
+    def on_close(self) -> None:
+        selection_history.pop(self.view.id(), None)
+
+
+class SelectionUndoCommand(TextCommand):
+    def run(self, _, forward: bool = False) -> None:
+        v = self.view
+        history = _history_for_view(v)
+        regions = history.redo() if forward else history.undo()
+        if not regions:
+            status_message(f"No selection to {'redo' if forward else 'undo'}")
+            return
+
+        vid = v.id()
+        s = v.sel()
+        s.clear()
+        for a, b in sorted(regions, key=lambda r: min(r)):
+            add_region(vid, a, b, 0.0)
+        show_point(vid, s[-1 if forward else 0].b, False, False, False)
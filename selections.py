@@ -1,9 +1,11 @@
 import re
 from collections import defaultdict
-from typing import Dict, List, Tuple
+from re import Pattern
+from typing import Dict, List, Set, Tuple
 
 import sublime_plugin
-from sublime import Edit, Region, View, active_window
+from sublime import HIDDEN, Edit, Region, View, active_window, status_message
+from sublime_api import view_add_regions  # pyright: ignore
 from sublime_api import view_cached_substr as substr  # pyright: ignore
 from sublime_api import view_selection_add_point as add_point  # pyright: ignore
 from sublime_api import view_selection_add_region as add_region  # pyright: ignore
@@ -13,7 +15,14 @@ from sublime_api import (
 from sublime_api import view_show_point as show_point  # pyright: ignore
 from sublime_plugin import TextCommand, TextInputHandler
 
-from .base import buffer_slice
+from .base import (
+    buffer_chunks,
+    buffer_slice,
+    intersect_intervals,
+    substr_many,
+    subtract_intervals,
+    union_intervals,
+)
 
 # expand to next
 matchers: str = """([{)]}"'"""
@@ -24,7 +33,7 @@ pattern_cache = {}
 
 
 class SmarterSelectLines(TextCommand):
-    def run(self, edit, forward: bool):
+    def run(self, edit, forward: bool, count: int = 1):
         v = self.view
         s = v.sel()
 
@@ -71,32 +80,37 @@ class SmarterSelectLines(TextCommand):
 
         mode = "normal" if softbol == hardeol else "softbol" if softbol else "hardeol"
 
-        current_lines: set[int] = {v.line(r.b).a for r in selections}
-        if forward:
-            next_lines = [v.line(v.line(pt).b + 1) for _, pt in selections]
-        else:
-            next_lines = [v.line(v.line(pt).a - 1) for pt in current_lines if pt > 1]
+        lines = [v.line(r.b) for r in selections]
+        current_lines: set[int] = {line.a for line in lines}
+        size = v.size()
         folds = v.folded_regions()
-        for i, next_line in enumerate(next_lines):
-            if next_line.a in current_lines:
-                continue
+        # Each cursor adds the count lines after (or before) it, which is
+        # what running the command count times would have selected
+        for line, col in zip(lines, columns):
+            for _ in range(count):
+                if forward and line.b >= size or not forward and line.a <= 0:
+                    break
+                next_line = v.line(line.b + 1) if forward else v.line(line.a - 1)
+                line = next_line
+                if next_line.a in current_lines:
+                    continue
 
-            if f := next((f for f in folds if next_line.intersects(f)), None):
-                [s.add(reg.a) for reg in v.lines(f)]
+                if f := next((f for f in folds if next_line.intersects(f)), None):
+                    [s.add(reg.a) for reg in v.lines(f)]
+                    line = v.line(f.end() if forward else f.begin())
 
-            elif next_line.empty():
-                s.add(next_line.a)
+                elif next_line.empty():
+                    s.add(next_line.a)
 
-            elif mode == "hardeol":
-                s.add(next_line.b)
+                elif mode == "hardeol":
+                    s.add(next_line.b)
 
-            elif mode == "softbol":
-                mysubstr: str = substr(vid, next_line.a, next_line.b)
-                idx = len(mysubstr) - len(mysubstr.lstrip())
-                s.add(next_line.a + idx)
-            else:
-                col = columns[i]
-                s.add(min((next_line.a + col), next_line.b))
+                elif mode == "softbol":
+                    mysubstr: str = substr(vid, next_line.a, next_line.b)
+                    idx = len(mysubstr) - len(mysubstr.lstrip())
+                    s.add(next_line.a + idx)
+                else:
+                    s.add(min((next_line.a + col), next_line.b))
 
         cursor = s[-1 if forward else 0]
         for fold in folds:
@@ -203,6 +217,117 @@ class PatternInputHandler(TextInputHandler):
         return len(name) > 0
 
 
+compiled_patterns: Dict[str, Pattern] = {}
+
+
+def compile_pattern(pattern: str) -> Pattern:
+    if (rgx := compiled_patterns.get(pattern)) is None:
+        rgx = compiled_patterns[pattern] = re.compile(pattern)
+    return rgx
+
+
+class FilterSelectionsCommand(TextCommand):
+    def input(self, args):
+        if "pattern" not in args:
+            return PatternInputHandler(pattern_cache.get("filter", ""))
+
+    def input_description(self) -> str:
+        return "Filter"
+
+    def run(self, _, pattern: str, keep: bool = True) -> None:
+        v = self.view
+        s = v.sel()
+        if not pattern or len(s) == 0:
+            return
+
+        pattern_cache["filter"] = pattern
+        try:
+            rgx = compile_pattern(pattern)
+        except re.error as e:
+            status_message(f"Invalid pattern: {e}")
+            return
+
+        vid = v.id()
+        regs = [(r.a, r.b) for r in s]
+        texts = substr_many(vid, regs)
+        survivors = [r for r, t in zip(regs, texts) if bool(rgx.search(t)) is keep]
+
+        if not survivors:
+            status_message("No selections left, keeping all")
+            return
+
+        status_message(f"{len(survivors)} of {len(s)} selections left")
+        s.clear()
+        for a, b in survivors:
+            add_region(vid, a, b, 0.0)
+        show_point(vid, s[-1].b, False, False, False)
+
+
+class SelectLinesMatchingCommand(TextCommand):
+    def input(self, args):
+        if "pattern" not in args:
+            return PatternInputHandler(pattern_cache.get("lines", ""))
+
+    def input_description(self) -> str:
+        return "Lines"
+
+    def run(self, _, pattern: str, inverse: bool = False) -> None:
+        v = self.view
+        if not pattern:
+            return
+
+        pattern_cache["lines"] = pattern
+        try:
+            rgx = compile_pattern(pattern)
+        except re.error as e:
+            status_message(f"Invalid pattern: {e}")
+            return
+
+        limit = v.settings().get("select_lines_matching_limit", 100_000)
+        vid = v.id()
+        s = v.sel()
+
+        # The buffer is read in chunks cut at their last newline, and the
+        # pattern searched in each line on its own so it can never match
+        # across lines
+        count = 0
+        start = 0
+        rest = ""
+        chunks = buffer_chunks(vid, 0, v.size())
+        while count < limit:
+            chunk = next(chunks, None)
+            if chunk is None:
+                lines = [rest]
+            else:
+                cut = chunk.rfind("\n") + 1
+                if not cut:
+                    rest += chunk
+                    continue
+                lines = (rest + chunk[:cut]).split("\n")[:-1]
+                rest = chunk[cut:]
+
+            for line in lines:
+                if (rgx.search(line) is None) == inverse:
+                    if count == 0:
+                        s.clear()
+                    add_point(vid, start)
+                    count += 1
+                    if count == limit:
+                        break
+                start += len(line) + 1
+
+            if chunk is None:
+                break
+
+        if count == 0:
+            status_message("No matching lines")
+            return
+
+        capped = " (limit reached)" if count == limit else ""
+        status_message(f"{count} lines selected{capped}")
+        show_point(vid, s[0].b, False, False, False)
+
+
 class SubtractSelectionCommand(sublime_plugin.TextCommand):
     def run(self, _, last=False) -> None:
         selections = self.view.sel()
@@ -212,17 +337,75 @@ class SubtractSelectionCommand(sublime_plugin.TextCommand):
             self.view.show(selections[sel].b, True)
 
 
-class RecordSelectionsCommand(sublime_plugin.TextCommand):
-    recorded_selections = {}
+REGISTER_PREFIX = "fly_register_"
+
+# view id -> names of the registers stored in that view
+registers: Dict[int, Set[str]] = defaultdict(set)
+
+
+def save_register(view: View, name: str, regions: List[Region]) -> None:
+    """Stores regions under a named key in the view. The editor keeps the
+    regions in sync with later edits, so no offsets go stale."""
+    vid = view.id()
+    key = REGISTER_PREFIX + name
+    view_add_regions(vid, key, regions, "", "", HIDDEN, [], "", None, None)
+    registers[vid].add(name)
+
+
+def load_register(view: View, name: str) -> List[Region]:
+    if name not in registers.get(view.id(), ()):
+        return []
+    return view.get_regions(REGISTER_PREFIX + name)
 
-    def run(self, edit, retrieve: bool = False):
-        vi = self.view.id()
+
+class RegisterListener(sublime_plugin.ViewEventListener):
+    @classmethod
+    def applies_to_primary_view_only(cls) -> bool:
+        return False
+
+    def on_close(self) -> None:
+        registers.pop(self.view.id(), None)
+
+
+class RecordSelectionsCommand(sublime_plugin.TextCommand):
+    def run(self, edit, retrieve: bool = False, register: str = "0"):
+        v = self.view
         if retrieve:
-            for r in self.recorded_selections.get(vi, []):
-                add_region(vi, r[0], r[1], 0.0)
+            if regs := load_register(v, register):
+                v.sel().add_all(regs)
+                v.show(regs[-1].b, False)
         else:
-            sels = self.view.sel()
-            self.recorded_selections[vi] = [(r.a, r.b) for r in sels]
+            save_register(v, register, list(v.sel()))
+
+
+class SelectionSetOperationCommand(sublime_plugin.TextCommand):
+    operations = {
+        "union": union_intervals,
+        "intersect": intersect_intervals,
+        "subtract": subtract_intervals,
+    }
+
+    def run(self, _, operation: str, register: str = "0") -> None:
+        v = self.view
+        if (op := self.operations.get(operation)) is None:
+            return
+
+        vid = v.id()
+        s = v.sel()
+        current = [(r.a, r.b) for r in s]
+        stored = [(r.a, r.b) for r in load_register(v, register)]
+        if not (regs := op(current, stored)):
+            status_message(f"Nothing left after {operation}, keeping the selection")
+            return
+
+        # Regions that come out unchanged keep their direction
+        reversed_regions = {(b, a) for a, b in (*current, *stored) if a > b}
+        s.clear()
+        for a, b in regs:
+            if (a, b) in reversed_regions:
+                a, b = b, a
+            add_region(vid, a, b, 0.0)
+        show_point(vid, s[-1].b, False, False, False)
 
 
 class FindNextLolCommand(sublime_plugin.TextCommand):
@@ -418,12 +601,10 @@ class SplitSelectionIntoLinesCommand(sublime_plugin.TextCommand):
 
     def bounds(self, regex: str):
         buf: View = self.view
-        selections = buf.sel()
+        regions = [r for r in buf.sel() if not r.empty()]
+        texts = substr_many(buf.id(), ((r.a, r.b) for r in regions))
         word_boundaries = []
-        for region in selections:
-            if region.empty():
-                continue
-            contents = buf.substr(region)
+        for region, contents in zip(regions, texts):
             begin = region.begin()
             local_bounds = [
                 (m.start() + begin, m.end() + begin)
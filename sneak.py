@@ -16,6 +16,7 @@ only_single_chars = charlist + "_\\./()\"'-:,;<>~!@#$%^&*|+=[]{}`~?/"
 _search_string = ""
 _forward = True
 _extend = False
+_count = 1
 matches = []
 
 
@@ -23,16 +24,20 @@ def set_chars(
     search_string: Optional[str] = None,
     forward: Optional[bool] = None,
     extend: Optional[bool] = None,
+    count: Optional[int] = None,
 ) -> None:
     global _search_string
     global _forward
     global _extend
+    global _count
     if search_string is not None:
         _search_string = search_string
     if forward is not None:
         _forward = forward
     if extend is not None:
         _extend = extend
+    if count is not None:
+        _count = count
 
 
 class NextCharacterBaseCommand(sublime_plugin.TextCommand):
@@ -43,7 +48,12 @@ class NextCharacterBaseCommand(sublime_plugin.TextCommand):
         )
 
     def execute(
-        self, search_string: str, forward: bool, extend: bool, special: bool
+        self,
+        search_string: str,
+        forward: bool,
+        extend: bool,
+        special: bool,
+        count: int = 1,
     ) -> bool:
         v = self.view
         global matches
@@ -67,12 +77,18 @@ class NextCharacterBaseCommand(sublime_plugin.TextCommand):
         cursors = []
         seen = set()
         for _, end in s if forward else reversed(s):
+            # the count-th match not taken by another cursor, in the same scan
+            skip = count - 1
             while m := bufind.send((end + offset, rgx)):
                 _, end = m
-                if end not in seen:
-                    seen.add(end)
-                    cursors.append(m)
-                    break
+                if end in seen:
+                    continue
+                if skip:
+                    skip -= 1
+                    continue
+                seen.add(end)
+                cursors.append(m)
+                break
 
         if not cursors:
             return False
@@ -140,11 +156,11 @@ class GoToNthMatchCommand(TextCommand):
 
 
 class ListenForCharacterCommand(TextCommand):
-    def run(self, _, forward: bool, extend: bool = False) -> None:
+    def run(self, _, forward: bool, extend: bool = False, count: int = 1) -> None:
         """
         Sets the buffer ready for search
         """
-        set_chars("", forward, extend)
+        set_chars("", forward, extend, count)
         arrow: str = "_❯" if forward else " ❮_"
         self.view.settings().set(key="block_caret", value=False)
         self.view.settings().set(key="needs_char", value=True)
@@ -212,14 +228,18 @@ class NextCharacterCommand(NextCharacterBaseCommand):
         self.view.settings().set(key="block_caret", value=True)
         self.view.settings().set(key="has_stored_search", value=True)
 
+        # The count applies to the last character only, the pair search
+        # starts from the match of the first one
+        last = len(search_string) == 2 or character in only_single_chars
         val = self.execute(
             search_string=search_string,
             forward=_forward,
             extend=_extend,
             special=len(search_string) == 2,
+            count=_count if last else 1,
         )
 
-        if len(search_string) == 2 or character in only_single_chars or not val:
+        if last or not val:
             self.view.settings().set(key="needs_char", value=False)
             arrow = f"{search_string}❯" if _forward else f"❮{search_string}"
         else:
@@ -229,12 +249,12 @@ class NextCharacterCommand(NextCharacterBaseCommand):
 
 
 class RepeatNextCharacterCommand(NextCharacterBaseCommand):
-    def run(self, _, forward: bool, extend: bool = False) -> None:
+    def run(self, _, forward: bool, extend: bool = False, count: int = 1) -> None:
         if not _search_string:
             return
 
         val = self.execute(
-            _search_string, forward=forward, extend=extend, special=False
+            _search_string, forward=forward, extend=extend, special=False, count=count
         )
 
         if len(_search_string) == 2 or _search_string in only_single_chars:
@@ -1,54 +1,103 @@
 import re
+from re import Pattern
+from typing import Dict, List, Optional, Sequence, Tuple
 
 import sublime_plugin
-from sublime import Edit, Region
+from sublime import Edit
 
-true_false_dict = {"false": "true", "False": "True", "true": "false", "True": "False"}
+from .base import EditBatch, lines_around, set_selection
+
+# Each group is a cycle, a token is replaced by the one after it. Override
+# with toggle_groups in the preferences or in the settings of a syntax.
+DEFAULT_GROUPS = [["false", "true"], ["False", "True"]]
+
+Groups = Tuple[Tuple[str, ...], ...]
+
+# dict from toggle groups to their compiled alternation and replacements,
+# None when the groups have no tokens
+toggle_patterns: Dict[Groups, Optional[Tuple[Pattern, Dict[str, str]]]] = {}
+
+
+def compile_groups(groups: Groups) -> Optional[Tuple[Pattern, Dict[str, str]]]:
+    if groups in toggle_patterns:
+        return toggle_patterns[groups]
+
+    replacements: Dict[str, str] = {}
+    for group in groups:
+        group = tuple(token for token in group if token)
+        for token, following in zip(group, group[1:] + group[:1]):
+            replacements.setdefault(token, following)
+
+    if not replacements:
+        toggle_patterns[groups] = None
+        return None
+
+    # Longest first so that a token wins over its prefixes, and tokens that
+    # start or end with a word character only match whole words
+    alternatives = []
+    for token in sorted(replacements, key=len, reverse=True):
+        before = r"\b" if re.match(r"\w", token) else ""
+        after = r"\b" if re.search(r"\w$", token) else ""
+        alternatives.append(before + re.escape(token) + after)
+
+    compiled = (re.compile("|".join(alternatives)), replacements)
+    toggle_patterns[groups] = compiled
+    return compiled
+
+
+def nearest_match(
+    pattern: Pattern, line: str, column: int
+) -> Optional[Tuple[int, int, str]]:
+    """The token under column, or else the closest one; ties go left."""
+    best: Optional[Tuple[int, int, str]] = None
+    best_distance = 0
+    for m in pattern.finditer(line):
+        start, end = m.span()
+        distance = max(start - column, column - end, 0)
+        if best is None or distance < best_distance:
+            best = (start, end, m.group())
+            best_distance = distance
+        if start > column:
+            break
+    return best
 
 
 class ToggleTrueFalseCommand(sublime_plugin.TextCommand):
-    """First we try around the cursor (-6, +6), else we try the whole line"""
+    """
+    Replaces the token nearest to each cursor on its line with the next one
+    of its toggle group, by default true/false.
+    """
 
     def run(self, edit: Edit) -> None:
         buf = self.view
-        for region in reversed(buf.sel()):
-            if region.empty():
-                linestr = self.view.substr(Region(region.a - 6, region.a + 6))
-                g = [
-                    (m.start(), m.end(), m.groups()[0])
-                    for m in re.finditer(r"((F|f)alse|(T|t)rue)", linestr)
-                ]
-                # if more than one match was found, we take the one that is nearest
-                # the caret
-                if len(g) > 2:
-                    return
-                elif len(g) == 2:
-                    if abs(6 - g[1][0]) > abs(6 - g[0][1]):
-                        myval = 0
-                    else:
-                        myval = 1
-                    begin = g[myval][0] + region.begin() - 6
-                    end = g[myval][1] + region.begin() - 6
-                    mybool = g[myval][2]
-                elif len(g) == 1:
-                    begin = g[0][0] + region.begin() - 6
-                    end = g[0][1] + region.begin() - 6
-                    mybool = g[0][2]
-                elif len(g) == 0:
-                    lr = self.view.line(region.begin())
-                    linestr = self.view.substr(Region(lr.a, lr.b))
-                    g = re.search(r"((F|f)alse|(T|t)rue)", linestr)
-                    if g is None:
-                        return
-                    begin = g.span()[0] + lr.a
-                    end = g.span()[1] + lr.a
-                    mybool = g.group(0)
-                else:
-                    return
-                myregion = Region(begin, end)
-                buf.sel().subtract(region)
-                myopposite = true_false_dict[mybool]
-                buf.replace(edit, myregion, myopposite)
-                buf.sel().add(begin)
+        groups: Sequence[List[str]] = buf.settings().get(
+            "toggle_groups", DEFAULT_GROUPS
+        )
+        if (compiled := compile_groups(tuple(map(tuple, groups)))) is None:
+            return
+        pattern, replacements = compiled
+
+        regs = [(r.a, r.b) for r in buf.sel()]
+        cursors = [a for a, b in regs if a == b]
+        batch = EditBatch(buf, edit)
+        moved = {}
+        tokens = set()
+        for pt, (line_start, line) in zip(cursors, lines_around(buf, cursors)):
+            if (match := nearest_match(pattern, line, pt - line_start)) is None:
+                continue
+            start, end, token = match
+            begin = line_start + start
+            if begin not in tokens:
+                tokens.add(begin)
+                batch.replace(begin, line_start + end, replacements[token])
+            moved[pt] = begin
+
+        batch.apply(clear_selection=True)
+        new_regs = []
+        for a, b in regs:
+            if (pt := moved.get(a)) is not None and a == b:
+                pt = batch.map(pt, after=False)
+                new_regs.append((pt, pt))
             else:
-                pass
+                new_regs.append((batch.map(a), batch.map(b)))
+        set_selection(buf, new_regs)
@@ -50,6 +50,19 @@ revert_to_normal_mode = [
     "go_to_nth_match",
 ]
 
+# Commands that take the multiplier as a count argument instead of being
+# run multiplier times
+counted_cmds = [
+    "increment",
+    "decrement",
+    "duplicate_with_multiple_cursors",
+    "navigate_word",
+    "line_or_paragraph",
+    "smarter_select_lines",
+    "listen_for_character",
+    "repeat_next_character",
+]
+
 
 class JumpRecord:
     __slots__ = ["key", "view", "sheets"]
@@ -1216,6 +1229,13 @@ class BufferListener(sublime_plugin.ViewEventListener):
         if command_name != "set_number" and (
             multiplier := v.settings().get("multiplier")
         ):
+            if command_name in counted_cmds:
+                v.settings().erase("multiplier")
+                v.settings().erase("set_number")
+                pre_command(v, command_name)
+                count = (args or {}).get("count", 1) * multiplier
+                return (command_name, {**(args or {}), "count": count})
+
             for _ in range(multiplier - 1):
                 v.run_command(command_name, args)
             v.settings().erase("multiplier")